@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AIConversation
+from .models import AIConversation, PatientSummary
 
 @admin.register(AIConversation)
 class AIConversationAdmin(admin.ModelAdmin):
@@ -26,4 +26,12 @@ class AIConversationAdmin(admin.ModelAdmin):
             'fields': ('created_at',),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(PatientSummary)
+class PatientSummaryAdmin(admin.ModelAdmin):
+    list_display = ['patient', 'mode', 'records_covered', 'last_record_id', 'updated_at']
+    search_fields = ['patient__full_name', 'summary']
+    readonly_fields = ['created_at', 'updated_at']
+    ordering = ['-updated_at']
@@ -0,0 +1,267 @@
+# ai_assistant/knowledge.py
+import json
+import re
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+
+
+def normalize_text(text):
+    """Normaliza texto livre: minúsculas, sem acentos e sem pontuação"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+
+
+class KeywordMatcher:
+    """
+    Autômato de Aho–Corasick sobre palavras-chave normalizadas.
+    Encontra todas as ocorrências em uma única passada pelo texto,
+    independente do número de palavras-chave. Apenas palavras inteiras
+    casam ('aas' não é encontrado em 'aasxyz').
+    """
+    
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        
+        for keyword, value in keywords:
+            word = normalize_text(keyword)
+            if word:
+                self._add(word, value)
+        
+        self._build()
+    
+    def _add(self, word, value):
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][char] = next_node
+            node = next_node
+        self._out[node].append((len(word), value))
+    
+    def _build(self):
+        # Links de falha calculados em largura (BFS)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_node] = self._goto[fail].get(char, 0)
+                self._out[next_node] = self._out[next_node] + self._out[self._fail[next_node]]
+    
+    def find(self, text):
+        """Retorna (posição, valor) de cada palavra-chave encontrada como palavra inteira no texto"""
+        return [(start, value) for start, _, value in self.find_spans(text)]
+    
+    def find_spans(self, text):
+        """Como find, mas com (início, fim, valor) sobre o texto normalizado"""
+        text = normalize_text(text)
+        matches = []
+        node = 0
+        
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            
+            if i + 1 < len(text) and text[i + 1] != ' ':
+                continue
+            
+            for length, value in self._out[node]:
+                start = i - length + 1
+                if start == 0 or text[start - 1] == ' ':
+                    matches.append((start, i + 1, value))
+        
+        return matches
+
+
+class DiagnosisKnowledgeBase:
+    """Base de conhecimento do modo offline (regras por sintoma)"""
+    
+    def __init__(self, conditions, default, terms=None):
+        self.conditions = conditions
+        self.default = default
+        self._matcher = KeywordMatcher(
+            (keyword, index)
+            for index, condition in enumerate(conditions)
+            for keyword in [condition['name']] + condition.get('keywords', [])
+        )
+        
+        # Sinônimos de condições e termos gerais (intensidade, tempo) usados
+        # para reescrever o texto em uma forma canônica
+        self._canonical_matcher = KeywordMatcher(
+            [
+                (keyword, 'cond_' + normalize_text(condition['name']).replace(' ', '_'))
+                for condition in conditions
+                for keyword in [condition['name']] + condition.get('keywords', [])
+            ] + [
+                (synonym, normalize_text(term))
+                for term, synonyms in (terms or {}).items()
+                for synonym in [term] + synonyms
+            ]
+        )
+    
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['conditions'], data['default'], data.get('terms'))
+    
+    def canonicalize(self, text):
+        """
+        Reescreve o texto trocando sinônimos pela forma canônica
+        ("cefaleia intensa" e "dor de cabeça forte" ficam iguais)
+        """
+        text = normalize_text(text)
+        
+        # Prefere a ocorrência mais longa quando há sobreposição
+        spans = sorted(self._canonical_matcher.find_spans(text), key=lambda m: (m[0], -m[1]))
+        
+        parts, position = [], 0
+        for start, end, canonical in spans:
+            if start < position:
+                continue
+            parts.append(text[position:start])
+            parts.append(canonical)
+            position = end
+        parts.append(text[position:])
+        
+        return ' '.join(''.join(parts).split())
+    
+    def match(self, text):
+        """Condições encontradas no texto, ordenadas por nº de menções e posição"""
+        hits = {}
+        # Sinônimos sobrepostos na mesma posição ("tosse", "tosse seca") contam uma vez
+        for position, index in set(self._matcher.find(text)):
+            count, first = hits.get(index, (0, position))
+            hits[index] = (count + 1, min(first, position))
+        
+        ranked = sorted(hits.items(), key=lambda item: (-item[1][0], item[1][1]))
+        return [(self.conditions[index], count) for index, (count, _) in ranked]
+    
+    def differential(self, text, limit=5):
+        """Combina as condições encontradas em um único diagnóstico diferencial"""
+        matched = self.match(text)
+        if not matched:
+            return {**self.default, 'matched_conditions': []}
+        
+        total_weight = sum(count for _, count in matched)
+        scores = {}
+        for condition, count in matched:
+            for diagnosis in condition['diagnoses']:
+                scores[diagnosis['name']] = scores.get(diagnosis['name'], 0) + diagnosis['probability'] * count
+        
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        
+        return {
+            'diagnoses': [
+                {'name': name, 'probability': round(score / total_weight)}
+                for name, score in ranked
+            ],
+            'exams': self._merge(condition['exams'] for condition, _ in matched),
+            'red_flags': self._merge(condition['red_flags'] for condition, _ in matched),
+            'conduct': '; '.join(self._merge([condition['conduct']] for condition, _ in matched)),
+            'matched_conditions': [condition['name'] for condition, _ in matched],
+        }
+    
+    @staticmethod
+    def _merge(groups):
+        merged = []
+        for group in groups:
+            merged.extend(item for item in group if item not in merged)
+        return merged
+
+
+@lru_cache(maxsize=1)
+def get_diagnosis_knowledge_base():
+    """Carregada e compilada uma única vez por processo"""
+    return DiagnosisKnowledgeBase.from_file(DATA_DIR / 'diagnoses.json')
+
+
+class InteractionIndex:
+    """
+    Índice de interações medicamentosas: nomes/sinônimos normalizados para um
+    id canônico e mapa de adjacência entre ids. Verificar n medicamentos custa
+    O(n + interações encontradas), sem comparar todos os pares.
+    """
+    
+    def __init__(self, medications, interactions):
+        self._aliases = {}
+        for canonical, aliases in medications.items():
+            for alias in [canonical] + aliases:
+                self._aliases[normalize_text(alias)] = canonical
+        
+        # Encontra o medicamento dentro de nomes com dose/apresentação ("Marevan 5mg")
+        self._matcher = KeywordMatcher(self._aliases.items())
+        
+        self._adjacency = {}
+        for interaction in interactions:
+            first, second = interaction['medications']
+            details = {
+                'severity': interaction['severity'],
+                'description': interaction['description'],
+            }
+            self._adjacency.setdefault(first, {})[second] = details
+            self._adjacency.setdefault(second, {})[first] = details
+    
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['medications'], data['interactions'])
+    
+    def canonical(self, name):
+        """Id canônico do medicamento ou None se desconhecido"""
+        normalized = normalize_text(name)
+        if normalized in self._aliases:
+            return self._aliases[normalized]
+        
+        matches = self._matcher.find(normalized)
+        return min(matches)[1] if matches else None
+    
+    def check(self, names):
+        """Interações entre os medicamentos informados"""
+        present = {}
+        for name in names:
+            canonical = self.canonical(name)
+            if canonical is not None:
+                present.setdefault(canonical, name)
+        
+        found = []
+        for canonical, name in present.items():
+            neighbours = self._adjacency.get(canonical, {})
+            
+            # Percorre o menor dos dois conjuntos
+            if len(neighbours) <= len(present):
+                candidates = (other for other in neighbours if other in present)
+            else:
+                candidates = (other for other in present if other in neighbours)
+            
+            for other in candidates:
+                if canonical < other:
+                    found.append({
+                        'medications': [name, present[other]],
+                        **neighbours[other],
+                    })
+        
+        return found
+
+
+@lru_cache(maxsize=1)
+def get_interaction_index():
+    """Carregado uma única vez por processo"""
+    return InteractionIndex.from_file(DATA_DIR / 'drug_interactions.json')
@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-18 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_assistant', '0002_delete_prescription'),
+        ('patients', '0003_remove_patient_address_patient_city_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('summary', models.TextField()),
+                ('last_record_id', models.BigIntegerField(default=0, help_text='Último prontuário incluído no resumo')),
+                ('records_covered', models.IntegerField(default=0)),
+                ('mode', models.CharField(blank=True, help_text="Modelo que gerou o resumo ('mock' sem API)", max_length=100)),
+                ('records_digest', models.CharField(blank=True, help_text='Quantidade e última alteração dos prontuários até last_record_id', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_summary', to='patients.patient')),
+            ],
+        ),
+    ]
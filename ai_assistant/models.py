@@ -20,3 +20,23 @@ class AIConversation(models.Model):
     
     def __str__(self):
         return f"Conversa {self.user.username} - {self.created_at}"
+
+
+class PatientSummary(models.Model):
+    """Resumo clínico de IA persistido e atualizado incrementalmente"""
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, related_name='ai_summary')
+    
+    summary = models.TextField()
+    last_record_id = models.BigIntegerField(default=0, help_text="Último prontuário incluído no resumo")
+    records_covered = models.IntegerField(default=0)
+    mode = models.CharField(max_length=100, blank=True, help_text="Modelo que gerou o resumo ('mock' sem API)")
+    records_digest = models.CharField(
+        max_length=64, blank=True,
+        help_text="Quantidade e última alteração dos prontuários até last_record_id"
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Resumo {self.patient.full_name} - {self.updated_at}"
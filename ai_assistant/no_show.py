@@ -0,0 +1,323 @@
+# ai_assistant/no_show.py
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+
+
+# Ordem das colunas usada no treino e na inferência
+FEATURES = ('lead_days', 'hour', 'weekday', 'previous_no_shows', 'is_first', 'appointment_type')
+
+ARTIFACT_PREFIX = 'no_show-'
+ARTIFACT_SUFFIX = '.joblib'
+
+# Tipos de consulta mais frequentes viram categorias; os demais recebem -1
+MAX_APPOINTMENT_TYPES = 30
+
+
+def normalize_appointment_type(value):
+    return ' '.join(str(value or '').lower().split())
+
+
+def history_features(frame):
+    """
+    previous_no_shows e is_first de cada linha (patient_id, date_time, status):
+    faltas entre as consultas não canceladas anteriores do mesmo paciente e
+    se não há nenhuma. Mesma definição no treino e na inferência; linhas
+    canceladas não entram no resultado
+    """
+    import pandas as pd
+
+    frame = frame[frame['status'] != 'cancelled'].sort_values(['patient_id', 'date_time'], kind='stable')
+    is_no_show = (frame['status'] == 'no_show').astype(np.int64)
+
+    return pd.DataFrame({
+        'previous_no_shows': is_no_show.groupby(frame['patient_id']).cumsum() - is_no_show,
+        'is_first': (frame.groupby('patient_id').cumcount() == 0).astype(np.int64),
+    }, index=frame.index)
+
+
+def appointment_history(appointments):
+    """
+    [(previous_no_shows, is_first)] de cada Appointment da lista, como em
+    history_features, com o histórico dos pacientes em uma única consulta
+    """
+    import pandas as pd
+    from appointments.models import Appointment
+
+    fields = ['patient_id', 'date_time', 'status']
+    rows = Appointment.objects.filter(
+        patient_id__in={a.patient_id for a in appointments},
+        date_time__lte=max(a.date_time for a in appointments),
+    ).exclude(status='cancelled').exclude(id__in=[a.id for a in appointments]).order_by().values_list(*fields)
+
+    # As consultas avaliadas entram depois do histórico; uma cancelada é
+    # avaliada como se estivesse marcada
+    targets = [
+        (a.patient_id, a.date_time, 'scheduled' if a.status == 'cancelled' else a.status)
+        for a in appointments
+    ]
+    history = list(rows)
+    frame = pd.DataFrame.from_records(history + targets, columns=fields)
+    features = history_features(frame).loc[range(len(history), len(frame))]
+
+    return [(int(row.previous_no_shows), bool(row.is_first)) for row in features.itertuples()]
+
+
+def build_training_frame(appointments=None):
+    """
+    Monta o conjunto de treino a partir do histórico de Appointment.
+    Apenas consultas concluídas ou com falta entram como exemplo, mas todas
+    as anteriores do paciente contam para faltas prévias e primeira consulta.
+    """
+    import pandas as pd
+    from appointments.models import Appointment
+
+    if appointments is None:
+        appointments = Appointment.objects.all()
+
+    fields = ['patient_id', 'date_time', 'created_at', 'status', 'appointment_type']
+    rows = appointments.exclude(status='cancelled').order_by().values_list(*fields)
+    frame = pd.DataFrame.from_records(list(rows), columns=fields)
+
+    if frame.empty:
+        return frame.assign(**{name: [] for name in FEATURES}, no_show=[])
+
+    local_time = pd.to_datetime(frame['date_time'], utc=True).dt.tz_convert(settings.TIME_ZONE)
+    booked_at = pd.to_datetime(frame['created_at'], utc=True).dt.tz_convert(settings.TIME_ZONE)
+
+    frame = frame.assign(local_time=local_time).sort_values(['patient_id', 'local_time'], kind='stable')
+    is_no_show = (frame['status'] == 'no_show').astype(np.int64)
+
+    frame['lead_days'] = (
+        frame['local_time'].dt.normalize() - booked_at.loc[frame.index].dt.normalize()
+    ).dt.days.clip(lower=0)
+    frame['hour'] = frame['local_time'].dt.hour
+    frame['weekday'] = frame['local_time'].dt.weekday
+    frame = frame.join(history_features(frame))
+    frame['appointment_type'] = frame['appointment_type'].map(normalize_appointment_type)
+    frame['no_show'] = is_no_show
+
+    labeled = frame[frame['status'].isin(['completed', 'no_show'])]
+    return labeled.reset_index(drop=True)
+
+
+class FlatForest:
+    """
+    Floresta de árvores de decisão em arrays planos (nós de todas as árvores
+    concatenados). Uma consulta percorre todas as árvores em paralelo com
+    operações NumPy, sem depender do scikit-learn na inferência.
+    """
+
+    ARRAYS = ('left', 'right', 'feature', 'threshold', 'proba', 'roots')
+
+    def __init__(self, left, right, feature, threshold, proba, roots, depth):
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.proba = proba
+        self.roots = roots
+        self.depth = depth
+
+    @classmethod
+    def from_estimator(cls, forest):
+        left, right, feature, threshold, proba, roots = [], [], [], [], [], []
+        offset = 0
+        depth = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            size = tree.node_count
+            nodes = np.arange(size) + offset
+            is_leaf = tree.children_left == -1
+
+            # Folhas apontam para si mesmas: a descida pode seguir um número
+            # fixo de passos para todas as árvores
+            left.append(np.where(is_leaf, nodes, tree.children_left + offset))
+            right.append(np.where(is_leaf, nodes, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+
+            counts = tree.value[:, 0, :]
+            class_proba = counts / counts.sum(axis=1, keepdims=True)
+            positive = list(forest.classes_).index(1) if 1 in forest.classes_ else None
+            proba.append(class_proba[:, positive] if positive is not None else np.zeros(size))
+
+            roots.append(offset)
+            offset += size
+            depth = max(depth, tree.max_depth)
+
+        return cls(
+            np.concatenate(left).astype(np.int32),
+            np.concatenate(right).astype(np.int32),
+            np.concatenate(feature).astype(np.int32),
+            np.concatenate(threshold),
+            np.concatenate(proba),
+            np.array(roots, dtype=np.int32),
+            depth,
+        )
+
+    def predict_proba(self, X):
+        """Probabilidade da classe positiva para cada linha de X (n, features)"""
+        # O scikit-learn compara os atributos em float32
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.proba[nodes].mean(axis=1)
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.ARRAYS}
+        data['depth'] = self.depth
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*(data[name] for name in cls.ARRAYS), data['depth'])
+
+
+class NoShowModel:
+    """Modelo de não comparecimento carregado de um artefato versionado"""
+
+    def __init__(self, artifact, path=None):
+        self.version = artifact['version']
+        self.trained_at = artifact['trained_at']
+        self.metrics = artifact.get('metrics', {})
+        self.path = path
+        self.forest = FlatForest.from_dict(artifact['forest'])
+        self._type_codes = {name: code for code, name in enumerate(artifact['appointment_types'])}
+
+    def encode_type(self, appointment_type):
+        return self._type_codes.get(normalize_appointment_type(appointment_type), -1)
+
+    def features(self, appointment_data):
+        return [
+            appointment_data.get('lead_days', appointment_data.get('days_until', 0)),
+            appointment_data.get('hour', 14),
+            appointment_data.get('weekday', 0),
+            appointment_data.get('previous_no_shows', 0),
+            int(bool(appointment_data.get('is_first', False))),
+            self.encode_type(appointment_data.get('appointment_type')),
+        ]
+
+    def predict(self, appointment_data):
+        return float(self.forest.predict_proba([self.features(appointment_data)])[0])
+
+    def predict_frame(self, frame):
+        """Probabilidades para um DataFrame com as colunas de FEATURES"""
+        X = np.column_stack([
+            frame['lead_days'].to_numpy(),
+            frame['hour'].to_numpy(),
+            frame['weekday'].to_numpy(),
+            frame['previous_no_shows'].to_numpy(),
+            frame['is_first'].to_numpy(dtype=np.int64),
+            frame['appointment_type'].map(self.encode_type).to_numpy(),
+        ])
+        return self.forest.predict_proba(X)
+
+
+def train_no_show_model(frame, n_estimators=100, max_depth=8, min_samples_leaf=20, random_state=42):
+    """Treina a floresta e retorna o artefato (dict) pronto para salvar"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    type_counts = frame['appointment_type'].value_counts()
+    appointment_types = list(type_counts.index[:MAX_APPOINTMENT_TYPES])
+    codes = {name: code for code, name in enumerate(appointment_types)}
+
+    X = np.column_stack([
+        frame['lead_days'], frame['hour'], frame['weekday'],
+        frame['previous_no_shows'], frame['is_first'],
+        frame['appointment_type'].map(lambda value: codes.get(value, -1)),
+    ]).astype(np.float32)
+    y = frame['no_show'].to_numpy()
+
+    forest = RandomForestClassifier(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        min_samples_leaf=min_samples_leaf,
+        n_jobs=-1,
+        random_state=random_state,
+    )
+    forest.fit(X, y)
+
+    trained_at = datetime.now()
+    return {
+        'version': trained_at.strftime('%Y%m%d%H%M%S'),
+        'trained_at': trained_at.isoformat(timespec='seconds'),
+        'features': list(FEATURES),
+        'appointment_types': appointment_types,
+        'params': forest.get_params(),
+        'samples': len(frame),
+        'forest': FlatForest.from_estimator(forest).to_dict(),
+    }
+
+
+def save_artifact(artifact, models_dir=None):
+    import joblib
+
+    models_dir = models_dir or settings.AI_MODELS_DIR
+    os.makedirs(models_dir, exist_ok=True)
+
+    path = os.path.join(models_dir, f"{ARTIFACT_PREFIX}{artifact['version']}{ARTIFACT_SUFFIX}")
+    joblib.dump(artifact, path)
+    return path
+
+
+def latest_artifact_path(models_dir=None):
+    """Versão fixada em AI_NO_SHOW_MODEL_VERSION ou a mais recente do diretório"""
+    models_dir = models_dir or settings.AI_MODELS_DIR
+
+    if settings.AI_NO_SHOW_MODEL_VERSION:
+        path = os.path.join(
+            models_dir, f'{ARTIFACT_PREFIX}{settings.AI_NO_SHOW_MODEL_VERSION}{ARTIFACT_SUFFIX}'
+        )
+        return path if os.path.exists(path) else None
+
+    try:
+        names = sorted(
+            name for name in os.listdir(models_dir)
+            if name.startswith(ARTIFACT_PREFIX) and name.endswith(ARTIFACT_SUFFIX)
+        )
+    except FileNotFoundError:
+        return None
+
+    return os.path.join(models_dir, names[-1]) if names else None
+
+
+def load_no_show_model(path):
+    import joblib
+
+    # Arrays mapeados em memória: processos do mesmo servidor compartilham
+    # as páginas do artefato pelo cache do sistema operacional
+    return NoShowModel(joblib.load(path, mmap_mode='r'), path=path)
+
+
+_model = None
+_model_loaded = False
+_model_pid = None
+_model_lock = threading.Lock()
+
+
+def get_no_show_model():
+    """Modelo carregado uma vez por processo (worker); None se não houver artefato"""
+    global _model, _model_loaded, _model_pid
+
+    pid = os.getpid()
+    if _model_loaded and _model_pid == pid:
+        return _model
+
+    with _model_lock:
+        if not _model_loaded or _model_pid != pid:
+            path = latest_artifact_path()
+            _model = load_no_show_model(path) if path else None
+            _model_loaded = True
+            _model_pid = pid
+
+    return _model
@@ -0,0 +1,12 @@
+# ai_assistant/signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from patients.models import MedicalRecord
+from .models import PatientSummary
+
+
+@receiver(post_delete, sender=MedicalRecord)
+def record_deleted(sender, instance, **kwargs):
+    # O resumo citaria um prontuário excluído: é refeito na próxima leitura
+    PatientSummary.objects.filter(patient_id=instance.patient_id, last_record_id__gte=instance.pk).delete()
@@ -0,0 +1,39 @@
+# ai_assistant/tasks.py
+from celery import shared_task
+
+from .services import get_ai_assistant
+
+
+@shared_task
+def differential_diagnosis_task(user_id, symptoms, patient_data, patient_id=None):
+    """Diagnóstico diferencial fora do ciclo da requisição HTTP"""
+    result = get_ai_assistant().get_differential_diagnosis(
+        symptoms, patient_data, user_id=user_id, patient_id=patient_id
+    )
+    return {'user_id': user_id, 'result': result}
+
+
+@shared_task
+def medical_summary_task(user_id, patient_id):
+    """Resumo clínico (incremental) fora do ciclo da requisição HTTP"""
+    from patients.models import Patient
+    
+    patient = Patient.objects.get(id=patient_id)
+    result = get_ai_assistant().get_rolling_summary(patient, user_id=user_id)
+    return {'user_id': user_id, 'result': result}
+
+
+@shared_task(ignore_result=True)
+def plan_overbooking_task(day=None):
+    """
+    Pré-calcula no cache compartilhado os planos de overbooking do dia (padrão:
+    hoje) para todos os médicos. Agendada no beat antes do expediente: a chave
+    do plano inclui os dias até a consulta, então um plano calculado na
+    véspera não seria reaproveitado depois da meia-noite
+    """
+    from datetime import date
+    from django.utils import timezone
+    from .services import OverbookingPlanner
+    
+    day = date.fromisoformat(day) if day else timezone.localdate()
+    OverbookingPlanner.plan_day(day)
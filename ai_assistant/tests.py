@@ -1,3 +1,771 @@
-from django.test import TestCase
+import itertools
+import random
+import tempfile
+from datetime import datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from ai_assistant import no_show
+from ai_assistant.knowledge import KeywordMatcher, get_interaction_index
+from ai_assistant.models import PatientSummary
+from ai_assistant.services import MedicalAIAssistant, PredictiveAnalytics
+from api.tests import ApiTestCase, process_caches
+from appointments.models import Appointment
+
+
+class RollingSummaryTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.create_patient(1)
+        self.records = [self.create_record(self.patient, diagnosis=f'Diagnóstico {index}') for index in range(3)]
+        self.ai = MedicalAIAssistant()
+        self.assertTrue(self.ai.use_mock)
+
+    def summarize(self):
+        with mock.patch.object(self.ai, 'generate_medical_summary', wraps=self.ai.generate_medical_summary) as generate:
+            self.ai.get_rolling_summary(self.patient)
+        return generate.call_count
+
+    def test_summary_is_reused_until_covered_records_change(self):
+        self.assertEqual(self.summarize(), 1)
+        stored = PatientSummary.objects.get()
+        self.assertEqual((stored.mode, stored.last_record_id), ('mock', self.records[-1].id))
+
+        self.assertEqual(self.summarize(), 0)
+
+        self.records[0].diagnosis = 'Outro diagnóstico'
+        self.records[0].save()
+        self.assertEqual(self.summarize(), 1)
+        self.assertEqual(self.summarize(), 0)
+
+    def test_summary_from_another_mode_is_rebuilt(self):
+        self.summarize()
+        PatientSummary.objects.update(mode='claude-sonnet-4-20250514')
+
+        self.assertEqual(self.summarize(), 1)
+        self.assertEqual(PatientSummary.objects.get().mode, 'mock')
+
+    def test_deleting_a_covered_record_discards_summary(self):
+        self.summarize()
+
+        self.records[1].delete()
+        self.assertFalse(PatientSummary.objects.exists())
+
+        self.assertEqual(self.summarize(), 1)
+        self.assertEqual(PatientSummary.objects.get().records_covered, 2)
+
+    @override_settings(AI_SUMMARY_MAX_NEW_RECORDS=4)
+    def test_records_beyond_the_window_are_folded_in_batches(self):
+        from ai_assistant.services import SUMMARY_ERROR_PREFIX
+
+        records = self.records + [
+            self.create_record(self.patient, diagnosis=f'Diagnóstico {index}') for index in range(3, 12)
+        ]
+        update = self.ai.update_medical_summary
+        batches = []
+
+        def fail_second_batch(summary, new_records):
+            batches.append([record['diagnosis'] for record in new_records])
+            if len(batches) == 2:
+                return f'{SUMMARY_ERROR_PREFIX}: timeout'
+            return update(summary, new_records)
+
+        with mock.patch.object(self.ai, 'update_medical_summary', side_effect=fail_second_batch):
+            self.assertEqual(self.summarize(), 1)
+            stored = PatientSummary.objects.get()
+            self.assertEqual((stored.records_covered, stored.last_record_id), (9, records[8].id))
+
+            self.assertEqual(self.summarize(), 0)
+
+        self.assertEqual(batches, [
+            [f'Diagnóstico {index}' for index in range(5, 9)],
+            [f'Diagnóstico {index}' for index in range(9, 12)],
+            [f'Diagnóstico {index}' for index in range(9, 12)],
+        ])
+        stored = PatientSummary.objects.get()
+        self.assertEqual((stored.records_covered, stored.last_record_id), (12, records[-1].id))
+
+
+class NoShowPredictionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.create_patient(1)
+        now = timezone.now()
+        for days, status in ((-40, 'completed'), (-30, 'no_show'), (-20, 'cancelled'), (-10, 'completed')):
+            self.create_appointment(self.patient, now + timedelta(days=days), status=status)
+        self.upcoming = self.create_appointment(self.patient, now + timedelta(days=5))
+
+        # Só consultas canceladas antes: ainda é a primeira
+        self.newcomer = self.create_patient(2)
+        self.create_appointment(self.newcomer, now - timedelta(days=3), status='cancelled')
+        self.first = self.create_appointment(self.newcomer, now + timedelta(days=2))
+
+        models_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(AI_MODELS_DIR=models_dir, AI_NO_SHOW_MODEL_VERSION=''))
+        self.enterContext(mock.patch.object(no_show, '_model_loaded', False))
+
+    def test_inference_features_match_training_frame(self):
+        frame = no_show.build_training_frame()
+        history = dict(zip(
+            Appointment.objects.filter(status__in=['completed', 'no_show']).order_by('date_time'),
+            frame.sort_values('date_time')[['previous_no_shows', 'is_first']].itertuples(index=False)
+        ))
+
+        for appointment, (previous_no_shows, is_first) in history.items():
+            self.assertEqual(
+                no_show.appointment_history([appointment]), [(previous_no_shows, bool(is_first))]
+            )
+
+        self.assertEqual(no_show.appointment_history([self.upcoming, self.first]), [(1, False), (0, True)])
+
+    def test_heuristic_is_used_without_artifact(self):
+        # Consulta, histórico do paciente e paciente (nome na resposta)
+        with self.assertNumQueries(3):
+            response = self.client.post(f'/api/appointments/{self.upcoming.id}/predict_no_show/')
+
+        self.assertIsNone(no_show.get_no_show_model())
+        # Base de 10% mais 30% por uma falta anterior
+        self.assertEqual(response.json()['no_show_probability'], 40.0)
+
+        frame = PredictiveAnalytics.no_show_frame([self.upcoming, self.first])
+        self.assertEqual(list(PredictiveAnalytics.predict_no_show_batch(frame)), [0.4, 0.2])
+
+    def test_latest_artifact_is_loaded(self):
+        frame = no_show.build_training_frame()
+        artifact = no_show.train_no_show_model(frame, n_estimators=5, min_samples_leaf=1)
+        path = no_show.save_artifact(artifact)
+
+        model = no_show.get_no_show_model()
+        self.assertEqual((model.version, model.path), (artifact['version'], path))
+
+        appointment_data = PredictiveAnalytics.no_show_frame([self.upcoming]).iloc[0].to_dict()
+        self.assertEqual(
+            PredictiveAnalytics.predict_appointment_no_show(appointment_data), model.predict(appointment_data)
+        )
+
+        with override_settings(AI_NO_SHOW_MODEL_VERSION='19990101000000'):
+            self.assertIsNone(no_show.latest_artifact_path())
+
+
+class HealthRiskScoreTests(SimpleTestCase):
+    # (idade, condições crônicas, PA sistólica, peso, altura); None = não registrado
+    PATIENTS = [
+        (40, '', 120, '70.00', '1.70'),
+        (41, 'Diabetes', 141, '70.00', '1.70'),
+        (50, 'diabetes, hipertensão', 140, '86.70', '1.70'),  # IMC exatamente 30
+        (51, 'Cardiopatia e câncer', 90, '53.47', '1.70'),
+        (65, 'HIPERTENSÃO', 89, '53.46', '1.70'),  # IMC logo abaixo de 18,5
+        (66, 'Diabetes, hipertensão, cardiopatia, câncer', 180, '120.00', '1.60'),
+        (70, None, None, '95.00', None),  # sem altura: 1,70 m
+        (30, 'asma', 150, None, '1.80'),  # sem peso: 70 kg
+        (45, '', None, None, None),  # sem sinais vitais
+        (0, '', 85, '3.50', '0.50'),
+    ]
+
+    def scalar(self, age, chronic_conditions, bp_sys, weight, height):
+        from decimal import Decimal
+
+        # Como em health_summary: Decimal dos campos do prontuário e None quando ausente
+        vitals = {
+            'blood_pressure_sys': bp_sys,
+            'weight': Decimal(weight) if weight else None,
+            'height': Decimal(height) if height else None,
+        }
+        return PredictiveAnalytics.calculate_health_risk_score(
+            {'age': age, 'chronic_conditions': chronic_conditions or ''}, [vitals]
+        )
+
+    def test_vectorized_scores_match_scalar_function(self):
+        import pandas as pd
+
+        panel = pd.DataFrame(
+            self.PATIENTS, columns=['age', 'chronic_conditions', 'blood_pressure_sys', 'weight', 'height']
+        )
+        scores = PredictiveAnalytics.calculate_health_risk_scores(panel)
+
+        for index, patient in enumerate(self.PATIENTS):
+            expected = self.scalar(*patient)
+            row = scores.iloc[index]
+            with self.subTest(patient=patient):
+                self.assertEqual(
+                    (row['age_risk'], row['chronic_risk'], row['vitals_risk']),
+                    tuple(expected['factors'][key] for key in ('age', 'chronic_conditions', 'vitals')),
+                )
+                self.assertEqual((row['total_score'], row['risk_level']), (expected['total_score'], expected['risk_level']))
+
+        self.assertEqual(list(scores['total_score']), [0, 40, 35, 45, 65, 100, 40, 20, 5, 35])
+
+
+class PopulationTrendTests(SimpleTestCase):
+    # patient_id: [(dias desde a primeira consulta, peso, PA sistólica)]
+    READINGS = {
+        1: [(0, 80.0, 130), (20, 81.5, 150), (45, None, 165), (100, 84.0, 120)],
+        2: [(0, 95.0, 145), (30, 93.0, 142), (90, 90.5, 150)],
+        3: [(0, 70.0, 118)],
+        4: [(0, 60.0, 110), (7, 60.2, 112), (14, 60.1, None), (60, 60.4, 115), (61, 60.4, 119)],
+    }
+
+    def setUp(self):
+        import pandas as pd
+
+        start = pd.Timestamp('2030-01-01', tz='UTC')
+        rows = [
+            (patient_id, start + pd.Timedelta(days=days), weight, bp_sys)
+            for patient_id, readings in self.READINGS.items()
+            for days, weight, bp_sys in readings
+        ]
+        # Fora de ordem, como vem do banco
+        self.vitals = pd.DataFrame(
+            rows, columns=['patient_id', 'created_at', 'weight', 'blood_pressure_sys']
+        ).sample(frac=1, random_state=1)
+
+    def patient(self, patient_id):
+        import pandas as pd
+
+        return pd.DataFrame(
+            self.READINGS[patient_id], columns=['days', 'weight', 'blood_pressure_sys'], dtype=float
+        )
+
+    def test_visit_axis_matches_per_patient_analysis(self):
+        import math
+
+        trends = PredictiveAnalytics.analyze_population_trends(self.vitals, time_axis='visit')
+
+        for patient_id in (1, 2, 4):
+            expected = PredictiveAnalytics.analyze_patient_trends(self.patient(patient_id))
+            row = trends.loc[patient_id]
+            with self.subTest(patient_id=patient_id):
+                self.assertAlmostEqual(row['weight_rate'], expected['weight']['rate'])
+                self.assertEqual(row['weight_direction'], expected['weight']['direction'])
+                self.assertEqual(row['weight_concern'], expected['weight']['concern'])
+                self.assertAlmostEqual(row['bp_mean'], expected['blood_pressure']['mean'])
+                self.assertAlmostEqual(row['bp_variability'], expected['blood_pressure']['variability'])
+                self.assertEqual(row['bp_concern'], expected['blood_pressure']['concern'])
+
+        # Uma única leitura: sem tendência nem alerta
+        single = trends.loc[3]
+        self.assertEqual((single['records'], single['sufficient_data'], single['concern']), (1, False, False))
+        self.assertIsNone(single['weight_direction'])
+        self.assertTrue(math.isnan(single['weight_slope']) and math.isnan(single['bp_variability']))
+
+    def test_date_axis_matches_polyfit_and_std(self):
+        import numpy as np
+
+        trends = PredictiveAnalytics.analyze_population_trends(self.vitals, time_axis='created_at')
+
+        for patient_id in (1, 2, 4):
+            readings = self.patient(patient_id)
+            weight = readings['weight'].ffill()
+            bp_sys = readings['blood_pressure_sys'].dropna()
+            row = trends.loc[patient_id]
+            with self.subTest(patient_id=patient_id):
+                self.assertAlmostEqual(row['weight_slope'], np.polyfit(readings['days'] / 30, weight, 1)[0])
+                self.assertAlmostEqual(row['weight_rolling_mean'], weight.tail(3).mean())
+                self.assertAlmostEqual(row['bp_variability'], np.std(bp_sys, ddof=1))
+                self.assertAlmostEqual(row['bp_rolling_mean'], readings['blood_pressure_sys'].tail(3).mean())
+
+        self.assertEqual(trends.loc[3, 'weight_rolling_mean'], 70.0)
+        self.assertFalse(trends.loc[3, 'sufficient_data'])
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def test_only_whole_words_match(self):
+        matcher = KeywordMatcher([('aas', 'aspirina'), ('dor de cabeca', 'cefaleia'), ('dor', 'dor')])
+
+        self.assertEqual(matcher.find('AAS 100mg'), [(0, 'aspirina')])
+        self.assertEqual(matcher.find('aasxyz'), [])
+        self.assertEqual(matcher.find('xaas'), [])
+        self.assertEqual(
+            sorted(matcher.find('Dor de cabeça há dois dias')), [(0, 'cefaleia'), (0, 'dor')]
+        )
+        self.assertEqual(matcher.find('dores'), [])
+
+    def test_unknown_medication_does_not_resolve_by_prefix(self):
+        index = get_interaction_index()
+
+        self.assertEqual(index.canonical('AAS 100mg'), 'aspirina')
+        self.assertEqual(index.canonical('Marevan 5mg'), 'varfarina')
+        self.assertIsNone(index.canonical('aasxyz'))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def call_while_leader_runs(self, result, followers=4):
+        """Líder bloqueado em fn enquanto os demais chegam com a mesma chave"""
+        import threading
+        import time
+
+        from ai_assistant.services import SingleFlight
+
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        outcomes = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        def call():
+            try:
+                outcomes.append(flight.do('chave', fn))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        started.wait(5)
+        threads += [threading.Thread(target=call) for _ in range(followers)]
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(flight._calls, {})
+        return len(calls), outcomes
+
+    @override_settings(AI_SINGLEFLIGHT_REDIS_URL='')
+    def test_concurrent_identical_calls_run_once(self):
+        calls, outcomes = self.call_while_leader_runs({'resumo': 'ok'})
+
+        self.assertEqual(calls, 1)
+        self.assertEqual(outcomes, [{'resumo': 'ok'}] * 5)
+
+    @override_settings(AI_SINGLEFLIGHT_REDIS_URL='')
+    def test_leader_error_reaches_waiting_callers(self):
+        error = RuntimeError('API indisponível')
+        calls, outcomes = self.call_while_leader_runs(error)
+
+        self.assertEqual(calls, 1)
+        self.assertEqual(outcomes, [error] * 5)
+
+    @override_settings(
+        AI_SINGLEFLIGHT_REDIS_URL='redis://127.0.0.1:1/0?socket_connect_timeout=0.1', AI_SINGLEFLIGHT_LOCK_TIMEOUT=1
+    )
+    def test_unreachable_redis_falls_back_to_direct_call(self):
+        from ai_assistant.services import SingleFlight
+
+        calls = []
+        flight = SingleFlight()
+
+        for _ in range(2):
+            self.assertEqual(flight.do('chave', lambda: calls.append(1) or 'resultado'), 'resultado')
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(AI_SINGLEFLIGHT_REDIS_URL='', AI_SINGLEFLIGHT_LOCK_TIMEOUT=0.1)
+    def test_follower_runs_alone_when_leader_hangs(self):
+        import threading
+
+        from ai_assistant.services import SingleFlight
+
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def hang():
+            started.set()
+            release.wait(5)
+            return 'líder'
+
+        leader = threading.Thread(target=flight.do, args=('chave', hang))
+        leader.start()
+        started.wait(5)
+        try:
+            self.assertEqual(flight.do('chave', lambda: 'seguidor'), 'seguidor')
+        finally:
+            release.set()
+            leader.join(5)
+
+    @override_settings(AI_SINGLEFLIGHT_REDIS_URL='redis://fake', AI_SINGLEFLIGHT_RESULT_TTL=15)
+    def test_only_successful_results_are_published(self):
+        from ai_assistant.services import SUMMARY_ERROR_PREFIX, SingleFlight, _is_summary_error
+
+        flight = SingleFlight()
+        flight._redis = client = mock.MagicMock()
+        client.get.return_value = None
+
+        for result, is_error in (
+            ({'error': 'API indisponível'}, None),
+            (f'{SUMMARY_ERROR_PREFIX}: timeout', _is_summary_error),
+        ):
+            self.assertEqual(flight.do('chave', lambda: result, is_error), result)
+        client.set.assert_not_called()
+
+        flight.do('chave', lambda: 'Resumo', _is_summary_error)
+        client.set.assert_called_once_with('singleflight:result:chave', '"Resumo"', ex=15)
+
+
+@override_settings(AI_SEMANTIC_CACHE_THRESHOLD=0.85, AI_SEMANTIC_CACHE_TTL=3600, AI_SEMANTIC_CACHE_MAX_ENTRIES=500)
+class SemanticDiagnosisCacheTests(SimpleTestCase):
+    PATIENT = {'age': 40, 'gender': 'Feminino', 'chronic_conditions': '', 'allergies': ''}
+
+    def setUp(self):
+        from ai_assistant.services import SemanticDiagnosisCache
+
+        self.cache = SemanticDiagnosisCache()
+        self.cache.add(1, 'Dor de cabeça forte há 3 dias', self.PATIENT, {'id': 'cefaleia'})
+
+    def lookup(self, symptoms, scope=1, patient=None):
+        return self.cache.lookup(scope, symptoms, patient or self.PATIENT)
+
+    def test_rewritten_symptoms_hit(self):
+        self.assertEqual(self.lookup('dor de cabeça forte há 3 dias'), {'id': 'cefaleia'})
+        self.assertEqual(self.lookup('cefaleia intensa, 3 dias'), {'id': 'cefaleia'})
+
+    def test_different_numbers_miss(self):
+        self.assertIsNone(self.lookup('dor de cabeça forte há 9 dias'))
+        self.assertIsNone(self.lookup('cefaleia intensa, 1 dia'))
+
+    def test_similarity_below_threshold_misses(self):
+        symptoms = 'dor de cabeça forte há 3 dias e náusea'
+        self.assertIsNone(self.lookup(symptoms))
+
+        with override_settings(AI_SEMANTIC_CACHE_THRESHOLD=0.6):
+            self.assertEqual(self.lookup(symptoms), {'id': 'cefaleia'})
+
+    def test_profile_conditions_and_scope_must_match(self):
+        self.assertIsNone(self.lookup('febre forte há 3 dias'))
+        self.assertIsNone(self.lookup('dor de cabeça forte há 3 dias', patient=dict(self.PATIENT, age=70)))
+        self.assertIsNone(self.lookup('dor de cabeça forte há 3 dias', scope=2))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (0, 3, 1))
+
+    def test_expired_and_evicted_entries_miss(self):
+        with override_settings(AI_SEMANTIC_CACHE_MAX_ENTRIES=1):
+            self.cache.add(1, 'febre alta e tosse', self.PATIENT, {'id': 'febre'})
+        self.assertIsNone(self.lookup('dor de cabeça forte há 3 dias'))
+        self.assertEqual(self.lookup('febre alta e tosse'), {'id': 'febre'})
+
+        with override_settings(AI_SEMANTIC_CACHE_TTL=-1):
+            self.assertIsNone(self.lookup('febre alta e tosse'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+
+class ConversationLogBufferTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        from ai_assistant.usage import ConversationLogBuffer
+
+        self.log = ConversationLogBuffer(max_size=3, batch_size=2, flush_interval=60)
+        # flush() é chamado pelo teste, sem a thread de gravação
+        self.enterContext(mock.patch.object(self.log, '_ensure_worker'))
+
+    def record(self, query):
+        self.log.record(
+            user_id=self.doctor.id, patient_id=None, query=query, response='ok',
+            context={'kind': 'test'}, tokens_used=10, response_time=0.1
+        )
+
+    def test_flush_writes_buffered_records_in_batches(self):
+        from ai_assistant.models import AIConversation
+
+        for index in range(4):
+            self.record(f'pergunta {index}')
+
+        # Buffer cheio descarta o registro mais antigo
+        self.assertEqual(self.log.dropped, 1)
+        self.assertEqual(AIConversation.objects.count(), 0)
+
+        with self.assertNumQueries(4):  # um INSERT por lote, entre SAVEPOINT e RELEASE
+            self.assertEqual(self.log.flush(), 3)
+        self.assertEqual(
+            sorted(AIConversation.objects.values_list('query', flat=True)),
+            ['pergunta 1', 'pergunta 2', 'pergunta 3']
+        )
+        self.assertEqual(self.log.flush(), 0)
+
+    def test_failed_flush_counts_dropped_records(self):
+        self.log.record(user_id=self.doctor.id, unknown_field=True)
+
+        with self.assertLogs('ai_assistant.usage', 'ERROR'):
+            self.assertEqual(self.log.flush(), 0)
+        self.assertEqual(self.log.dropped, 1)
+
+    def test_bad_row_does_not_discard_the_batch(self):
+        from ai_assistant.models import AIConversation
+
+        self.record('pergunta 1')
+        self.record(None)  # query é obrigatória: o INSERT do lote falha
+        self.record('pergunta 3')
+
+        with self.assertLogs('ai_assistant.usage', 'WARNING') as logs:
+            self.assertEqual(self.log.flush(), 2)
+        self.assertIn('ERROR:ai_assistant.usage:1 de 3 registro(s) de uso de IA descartado(s)', logs.output)
+        self.assertEqual(self.log.dropped, 1)
+        self.assertEqual(
+            sorted(AIConversation.objects.values_list('query', flat=True)), ['pergunta 1', 'pergunta 3']
+        )
+
+    @override_settings(AI_LOG_ENABLED=True)
+    def test_assistant_calls_are_recorded_without_touching_the_database(self):
+        patient = self.create_patient(1)
+        assistant = MedicalAIAssistant()
+
+        with mock.patch('ai_assistant.services.conversation_log', self.log), self.assertNumQueries(0):
+            assistant.analyze_prescription_interactions(
+                [{'name': 'Marevan'}, {'name': 'AAS'}], user_id=self.doctor.id, patient_id=patient.id
+            )
+        self.assertEqual(self.log.flush(), 1)
+
+
+@override_settings(
+    SCHEDULING_SLOT_MINUTES=30, SCHEDULING_WORK_HOURS='08:00-12:00,14:00-18:00', SCHEDULING_WORK_DAYS=[0, 1, 2, 3, 4]
+)
+class SmartSchedulingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.create_patient(1)
+        self.monday = timezone.make_aware(datetime(2030, 1, 7))
+
+    def at(self, hour, minute=0, days=0):
+        return self.monday + timedelta(days=days, hours=hour, minutes=minute)
+
+    def test_calendar_merges_adjacent_and_overlapping_appointments(self):
+        from ai_assistant.services import BusyCalendar
+
+        calendar = BusyCalendar([
+            (self.at(10), self.at(11)), (self.at(9), self.at(10)),  # adjacentes
+            (self.at(10, 30), self.at(12)),  # sobreposta
+            (self.at(13), self.at(14)),
+        ])
+
+        self.assertEqual(list(zip(calendar.starts, calendar.ends)), [
+            (self.at(9), self.at(12)), (self.at(13), self.at(14)),
+        ])
+        self.assertTrue(calendar.is_free(self.at(8), self.at(9)))
+        self.assertFalse(calendar.is_free(self.at(8, 30), self.at(9, 30)))
+        self.assertFalse(calendar.is_free(self.at(11, 59), self.at(12)))
+        self.assertTrue(calendar.is_free(self.at(12), self.at(13)))
+        self.assertFalse(calendar.is_free(self.at(8), self.at(15)))
+        self.assertEqual(list(calendar.gaps(self.at(8), self.at(15))), [
+            (self.at(8), self.at(9)), (self.at(12), self.at(13)), (self.at(14), self.at(15)),
+        ])
+
+        calendar.add(self.at(12), self.at(13))
+        self.assertEqual(list(zip(calendar.starts, calendar.ends)), [(self.at(9), self.at(14))])
+
+    def test_cancelled_appointments_do_not_block_slots(self):
+        from ai_assistant.services import BusyCalendar, SmartScheduling
+
+        self.create_appointment(self.patient, self.at(8), duration_minutes=60)
+        cancelled = self.create_appointment(self.patient, self.at(9), status='cancelled')
+
+        calendar = BusyCalendar.for_doctor(self.doctor.id, self.at(0), self.at(0, days=1))
+        self.assertEqual(list(zip(calendar.starts, calendar.ends)), [(self.at(8), self.at(9))])
+        self.assertEqual(
+            list(SmartScheduling.free_slots(calendar, self.at(0), self.at(0, days=1), limit=2)),
+            [self.at(9), self.at(9, 30)]
+        )
+
+        suggestion = SmartScheduling.suggest_optimal_appointment_time(
+            self.doctor.id, 'high', existing_appointments=[cancelled], start=self.at(0), days=1, count=1
+        )
+        self.assertEqual(suggestion['suggested_times'], [self.at(8)])
+
+    def test_slots_fit_before_the_end_of_each_working_period(self):
+        from ai_assistant.services import BusyCalendar, SmartScheduling
+
+        def slots(calendar, duration):
+            return list(SmartScheduling.free_slots(calendar, self.at(11), self.at(0, days=1), duration))
+
+        empty = BusyCalendar()
+        self.assertEqual(slots(empty, 30)[:2], [self.at(11), self.at(11, 30)])
+        self.assertEqual(slots(empty, 30)[-1], self.at(17, 30))
+        self.assertEqual(slots(empty, 60)[:2], [self.at(11), self.at(14)])
+        self.assertEqual(slots(empty, 60)[-1], self.at(17))
+        self.assertEqual(slots(empty, 45)[-1], self.at(17))
+
+        # Consulta fora da grade: a próxima começa no primeiro horário livre da grade
+        busy = BusyCalendar.from_appointments([(self.at(14), 75), (self.at(16, 40), 65)])
+        self.assertEqual(slots(busy, 30), [self.at(11), self.at(11, 30), self.at(15, 30), self.at(16)])
+
+        # Sábado e domingo não são dias úteis
+        weekend = SmartScheduling.free_slots(empty, self.at(18, days=4), self.at(0, days=8))
+        self.assertEqual(next(weekend), self.at(8, days=7))
+
+    def test_ranking_weighs_waiting_time_by_priority(self):
+        from ai_assistant.services import BusyCalendar, SmartScheduling
+
+        calendar = BusyCalendar.from_appointments([(self.at(8), 60)])
+        start, end = self.at(0), self.at(0, days=5)
+
+        high = SmartScheduling.rank_slots(calendar, 'high', start, end, count=3)
+        self.assertEqual(high[:3], [self.at(9), self.at(9, 30), self.at(10)])
+
+        # A espera custa pouco para prioridade baixa: a tarde vem antes
+        low = SmartScheduling.rank_slots(calendar, 'low', start, end, count=3)
+        self.assertTrue(all(timezone.localtime(slot).hour >= 14 for slot in low[:3]))
+        self.assertEqual(sorted(low), sorted(high))
+
+
+@override_settings(
+    SCHEDULING_SLOT_MINUTES=30, SCHEDULING_WORK_HOURS='08:00-12:00,14:00-18:00', SCHEDULING_WORK_DAYS=[0, 1, 2, 3, 4]
+)
+class WaitlistSchedulerTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        from django.contrib.auth.models import User
+
+        self.other = User.objects.create_user('other', password='secret')
+        self.patients = [self.create_patient(index) for index in range(5)]
+        self.monday = timezone.make_aware(datetime(2030, 1, 7))
+        self.create_appointment(self.patients[0], self.monday + timedelta(hours=9), duration_minutes=60)
+
+    def test_assignments_fit_free_working_hours(self):
+        from ai_assistant.services import WaitlistScheduler
+
+        rng = random.Random(1)
+        requests = [
+            {
+                'patient_id': rng.choice(self.patients).id,
+                'duration_minutes': rng.choice((30, 30, 60)),
+                'priority_score': rng.choice((0, 50, 100)),
+                'doctor_ids': rng.choice((None, [self.doctor.id], [self.other.id])),
+            }
+            for _ in range(150)
+        ]
+        earliest = self.monday + timedelta(days=3, hours=14)
+        requests.append({'patient_id': self.patients[1].id, 'duration_minutes': 30, 'earliest': earliest})
+        # Maior que qualquer período do expediente
+        requests.append({'patient_id': self.patients[2].id, 'duration_minutes': 300, 'priority_score': 100})
+
+        scheduler = WaitlistScheduler.for_doctors(
+            [self.doctor.id, self.other.id], self.monday, self.monday + timedelta(days=7)
+        )
+        result = scheduler.schedule(requests)
+
+        self.assertEqual(len(result['assignments']) + len(result['unassigned']), len(requests))
+        self.assertIn(requests[-1], result['unassigned'])
+        self.assertLessEqual(result['cost'], result['greedy_cost'])
+
+        periods = [(time(8), time(12)), (time(14), time(18))]
+        for assignment in result['assignments']:
+            if assignment.get('doctor_ids'):
+                self.assertIn(assignment['doctor_id'], assignment['doctor_ids'])
+            start = timezone.localtime(assignment['date_time'])
+            end = start + timedelta(minutes=assignment['duration_minutes'])
+            self.assertLess(start.weekday(), 5)
+            self.assertTrue(any(lower <= start.time() and end.time() <= upper for lower, upper in periods))
+            if 'earliest' in assignment:
+                self.assertGreaterEqual(assignment['date_time'], earliest)
+
+        created = WaitlistScheduler.save(result['assignments'])
+        self.assertEqual(len(created), len(result['assignments']))
+        self.assertEqual(Appointment.objects.filter(ai_suggested=True).count(), len(created))
+
+        for doctor in (self.doctor, self.other):
+            rows = list(
+                Appointment.objects.filter(doctor=doctor).order_by('date_time').values_list('date_time', 'end_time')
+            )
+            for (_, end), (start, _) in zip(rows, rows[1:]):
+                self.assertLessEqual(end, start)
+
+
+@override_settings(
+    SCHEDULING_SLOT_MINUTES=30, SCHEDULING_WORK_HOURS='08:00-12:00,14:00-18:00', SCHEDULING_WORK_DAYS=[0, 1, 2, 3, 4],
+    OVERBOOKING_BLOCK_MINUTES=60, OVERBOOKING_MAX_OVERFLOW=0.25, OVERBOOKING_MAX_EXTRA=2,
+)
+class OverbookingPlannerTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        models_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(AI_MODELS_DIR=models_dir, AI_NO_SHOW_MODEL_VERSION=''))
+        self.enterContext(mock.patch.object(no_show, '_model_loaded', False))
+
+        self.day = timezone.localdate() + timedelta(days=3)
+        while self.day.weekday() > 4:
+            self.day += timedelta(days=1)
+
+        patients = [self.create_patient(index) for index in range(3)]
+        self.create_appointment(patients[0], timezone.now() - timedelta(days=10), status='no_show')
+        self.appointments = [
+            self.create_appointment(patients[0], self.at(8), duration_minutes=30),
+            self.create_appointment(patients[1], self.at(8, 30), duration_minutes=60),
+            self.create_appointment(patients[2], self.at(14), duration_minutes=30),
+        ]
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def brute_force(self, items, capacity, extra_no_show):
+        """Maior número de encaixes dentro de OVERBOOKING_MAX_OVERFLOW, enumerando comparecimentos"""
+        from django.conf import settings
+
+        def overflow(extra):
+            everyone = items + [(1, extra_no_show)] * extra
+            total = 0.0
+            for shows in itertools.product((False, True), repeat=len(everyone)):
+                probability = 1.0
+                occupied = 0
+                for show, (units, no_show_probability) in zip(shows, everyone):
+                    probability *= (1 - no_show_probability) if show else no_show_probability
+                    occupied += units if show else 0
+                total += probability * max(0, occupied - capacity)
+            return total
+
+        limit = max(0, capacity - sum(units for units, _ in items)) + settings.OVERBOOKING_MAX_EXTRA
+        extra = 0
+        while extra < limit and overflow(extra + 1) <= settings.OVERBOOKING_MAX_OVERFLOW:
+            extra += 1
+        return extra, overflow(extra)
+
+    # Limite alto o bastante para haver encaixes além da capacidade
+    @override_settings(OVERBOOKING_MAX_OVERFLOW=0.6)
+    def test_extra_bookings_match_enumeration(self):
+        from ai_assistant.services import OverbookingPlanner, PredictiveAnalytics
+
+        first, second, afternoon = PredictiveAnalytics.predict_no_show_batch(
+            PredictiveAnalytics.no_show_frame(self.appointments)
+        )
+        self.assertGreater(first, second)  # falta anterior
+
+        plan, = OverbookingPlanner.plan_day(self.day, [self.doctor.id])
+        blocks = {timezone.localtime(block['start']).hour: block for block in plan['blocks']}
+        extra_no_show = (first + second + afternoon) / 3
+
+        for hour, items in ((8, [(1, first), (1, second)]), (9, [(1, second)]), (10, []), (14, [(1, afternoon)])):
+            extra, overflow = self.brute_force(items, 2, extra_no_show)
+            self.assertEqual(blocks[hour]['extra_bookings'], extra)
+            self.assertAlmostEqual(blocks[hour]['expected_overflow'], round(overflow, 3))
+
+        self.assertEqual((blocks[8]['capacity'], blocks[8]['booked']), (2, 2))
+        self.assertGreater(plan['overbooking'], 0)
+        self.assertEqual(plan['extra_bookings'], sum(block['extra_bookings'] for block in plan['blocks']))
+
+    def test_plan_is_cached_until_the_day_changes(self):
+        from ai_assistant.services import OverbookingPlanner
+
+        plan, = OverbookingPlanner.plan_day(self.day, [self.doctor.id])
+
+        # Apenas a impressão digital das consultas do dia
+        with self.assertNumQueries(1):
+            self.assertEqual(OverbookingPlanner.plan_day(self.day, [self.doctor.id]), [plan])
+
+        self.appointments[2].status = 'cancelled'
+        self.appointments[2].save()
+
+        plan, = OverbookingPlanner.plan_day(self.day, [self.doctor.id])
+        self.assertEqual(plan['appointments'], 2)
+
+        response = self.client.get(f'/api/appointments/overbooking/?date={self.day.isoformat()}')
+        self.assertEqual(response.json()['appointments'], 2)
+
+    def test_plan_warmed_by_worker_is_read_by_web_process(self):
+        from ai_assistant.services import OverbookingPlanner
+        from ai_assistant.tasks import plan_overbooking_task
+
+        with process_caches('worker'):
+            plan_overbooking_task(self.day.isoformat())
+
+        with process_caches('web'), self.assertNumQueries(1):
+            plan, = OverbookingPlanner.plan_day(self.day, [self.doctor.id])
+        self.assertEqual(plan['appointments'], 3)
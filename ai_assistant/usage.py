@@ -0,0 +1,126 @@
+# ai_assistant/usage.py
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationLogBuffer:
+    """
+    Registro write-behind das chamadas de IA em AIConversation.
+    A requisição apenas adiciona ao buffer em memória (limitado); uma thread
+    em segundo plano grava em lotes com bulk_create.
+    """
+    
+    def __init__(self, max_size, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        
+        self._buffer = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._worker_pid = None
+        atexit.register(self.flush)
+    
+    def record(self, **fields):
+        """Enfileira um registro; nunca acessa o banco no caminho da requisição"""
+        with self._lock:
+            # Buffer cheio: o registro mais antigo é descartado
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(fields)
+            pending = len(self._buffer)
+        
+        self._ensure_worker()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+    
+    def flush(self):
+        """
+        Grava tudo o que estiver no buffer; retorna o número de registros.
+        Se um lote falha, os registros são gravados um a um e só os inválidos
+        são descartados
+        """
+        from .models import AIConversation
+        
+        with self._lock:
+            batch = list(self._buffer)
+            self._buffer.clear()
+        
+        if not batch:
+            return 0
+        
+        conversations = []
+        for fields in batch:
+            try:
+                conversations.append(AIConversation(**fields))
+            except (TypeError, ValueError) as e:
+                logger.warning('Registro de uso de IA inválido descartado: %s', e)
+        
+        try:
+            with transaction.atomic():
+                AIConversation.objects.bulk_create(conversations, batch_size=self.batch_size)
+            written = len(conversations)
+        except Exception as e:
+            logger.warning('Falha ao gravar lote de uso de IA (%s); gravando um a um', e)
+            written = self._save_each(conversations)
+        
+        failed = len(batch) - written
+        if failed:
+            logger.error('%d de %d registro(s) de uso de IA descartado(s)', failed, len(batch))
+            with self._lock:
+                self.dropped += failed
+        
+        return written
+    
+    def _save_each(self, conversations):
+        written = 0
+        for conversation in conversations:
+            # Chave atribuída por um lote desfeito
+            conversation.pk = None
+            try:
+                with transaction.atomic():
+                    conversation.save(force_insert=True)
+            except Exception as e:
+                logger.warning('Registro de uso de IA descartado: %s', e)
+            else:
+                written += 1
+        return written
+    
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == pid:
+            return
+        
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive() or self._worker_pid != pid:
+                self._worker = threading.Thread(
+                    target=self._run, name='ai-usage-log', daemon=True
+                )
+                self._worker_pid = pid
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+conversation_log = ConversationLogBuffer(
+    max_size=settings.AI_LOG_BUFFER_SIZE,
+    batch_size=settings.AI_LOG_BATCH_SIZE,
+    flush_interval=settings.AI_LOG_FLUSH_INTERVAL,
+)
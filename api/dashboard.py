@@ -0,0 +1,242 @@
+# api/dashboard.py
+import hashlib
+import json
+import logging
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from core.shared_cache import CACHE_ERRORS, delete_keys, get_or_compute, shared_cache
+
+
+KEY_PREFIX = 'dashboard'
+
+logger = logging.getLogger(__name__)
+
+
+def patients_key(doctor_id):
+    return f'{KEY_PREFIX}:{doctor_id}:patients'
+
+
+def appointments_key(doctor_id, day):
+    return f'{KEY_PREFIX}:{doctor_id}:appointments:{day.isoformat()}'
+
+
+def pending_key(doctor_id):
+    return f'{KEY_PREFIX}:{doctor_id}:pending'
+
+
+def pending_until_key(doctor_id):
+    # Horário (timestamp) da próxima consulta pendente: a partir dele ela
+    # deixa de ser pendente sem que nenhuma linha mude, e o contador é refeito
+    return f'{KEY_PREFIX}:{doctor_id}:pending-until'
+
+
+def recent_key(doctor_id):
+    return f'{KEY_PREFIX}:{doctor_id}:recent'
+
+
+# Contagens no banco, agrupadas por médico (uma consulta cada)
+
+def count_active_patients(doctor_ids):
+    from patients.models import Patient
+    
+    rows = Patient.objects.filter(doctor_id__in=doctor_ids, is_active=True).order_by()
+    return dict(rows.values_list('doctor_id').annotate(total=Count('id')))
+
+
+def count_appointments_on(doctor_ids, day):
+    from appointments.models import Appointment
+    
+    rows = Appointment.objects.filter(doctor_id__in=doctor_ids, date_time__date=day).order_by()
+    return dict(rows.values_list('doctor_id').annotate(total=Count('id')))
+
+
+def count_pending(doctor_ids, now):
+    """{médico: (consultas pendentes, timestamp da próxima)}"""
+    from appointments.models import Appointment
+    
+    rows = Appointment.objects.filter(
+        doctor_id__in=doctor_ids, status='scheduled', date_time__gte=now
+    ).order_by().values('doctor_id').annotate(total=Count('id'), next_at=Min('date_time'))
+    return {row['doctor_id']: (row['total'], row['next_at'].timestamp()) for row in rows}
+
+
+# Leitura
+
+def get_counters(doctor_id):
+    """
+    Contadores do médico: do cache compartilhado quando disponível, senão
+    calculados no banco
+    """
+    cache = shared_cache()
+    if cache is not None:
+        try:
+            return _cached_counters(cache, doctor_id)
+        except CACHE_ERRORS as e:
+            logger.warning('Cache compartilhado indisponível (%s): contadores calculados no banco', e)
+    
+    return compute_counters(doctor_id, timezone.now())
+
+
+def compute_counters(doctor_id, now):
+    """Contadores calculados no banco, sem cache (três consultas)"""
+    pending, _ = count_pending([doctor_id], now).get(doctor_id, (0, math.inf))
+    return {
+        'total_patients': count_active_patients([doctor_id]).get(doctor_id, 0),
+        'appointments_today': count_appointments_on([doctor_id], timezone.localdate(now)).get(doctor_id, 0),
+        'pending_appointments': pending,
+    }
+
+
+def _cached_counters(cache, doctor_id):
+    """
+    Contadores lidos do cache (uma leitura). Os ausentes são calculados no
+    banco e gravados com add(), sem sobrescrever um incremento concorrente;
+    o contador de pendentes é refeito quando a próxima consulta pendente
+    fica no passado
+    """
+    now = timezone.now()
+    keys = {
+        'total_patients': patients_key(doctor_id),
+        'appointments_today': appointments_key(doctor_id, timezone.localdate(now)),
+        'pending_appointments': pending_key(doctor_id),
+    }
+    values = cache.get_many([*keys.values(), pending_until_key(doctor_id)])
+    ttl = settings.DASHBOARD_COUNTER_TTL
+    
+    if keys['total_patients'] not in values:
+        total = count_active_patients([doctor_id]).get(doctor_id, 0)
+        cache.add(keys['total_patients'], total, ttl)
+        values[keys['total_patients']] = total
+    
+    if keys['appointments_today'] not in values:
+        total = count_appointments_on([doctor_id], timezone.localdate(now)).get(doctor_id, 0)
+        cache.add(keys['appointments_today'], total, ttl)
+        values[keys['appointments_today']] = total
+    
+    pending_until = values.get(pending_until_key(doctor_id))
+    if keys['pending_appointments'] not in values or pending_until is None or now.timestamp() >= pending_until:
+        total, pending_until = count_pending([doctor_id], now).get(doctor_id, (0, math.inf))
+        cache.set_many({keys['pending_appointments']: total, pending_until_key(doctor_id): pending_until}, ttl)
+        values[keys['pending_appointments']] = total
+    
+    # Incrementos fora de ordem podem deixar um contador negativo até a reconciliação
+    return {name: max(0, values[key]) for name, key in keys.items()}
+
+
+def get_recent_records(doctor_id, load):
+    """Prontuários recentes já serializados; load() é chamado apenas sem cache"""
+    return get_or_compute(recent_key(doctor_id), load, settings.DASHBOARD_RECENT_TTL)
+
+
+def etag_for(payload):
+    content = json.dumps(payload, sort_keys=True, default=str)
+    return '"%s"' % hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+
+
+# Atualização pelos signals
+
+def appointment_counters(state, now):
+    """Contadores em que uma consulta (doctor_id, date_time, status) entra"""
+    counters = Counter()
+    if state is None or None in state[:2]:
+        return counters
+    
+    doctor_id, date_time, status = state
+    counters[appointments_key(doctor_id, timezone.localdate(date_time))] += 1
+    if status == 'scheduled' and date_time >= now:
+        counters[pending_key(doctor_id)] += 1
+    return counters
+
+
+def patient_counters(state):
+    """Contadores em que um paciente (doctor_id, is_active) entra"""
+    counters = Counter()
+    if state is not None and state[0] is not None and state[1]:
+        counters[patients_key(state[0])] += 1
+    return counters
+
+
+def apply_changes(old, new):
+    """Aplica a diferença entre dois conjuntos de contadores com incr/decr atômicos"""
+    cache = shared_cache()
+    if cache is None:
+        return
+    
+    try:
+        for key in old.keys() | new.keys():
+            delta = new[key] - old[key]
+            if not delta:
+                continue
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                # Contador ainda não está em cache: será calculado na próxima leitura
+                pass
+    except CACHE_ERRORS as e:
+        # A reconciliação periódica corrige os contadores que ficaram para trás
+        logger.warning('Cache compartilhado indisponível (%s): contadores não atualizados', e)
+
+
+def lower_pending_until(doctor_id, date_time):
+    """Uma consulta pendente nova antes da próxima conhecida antecipa a revalidação"""
+    cache = shared_cache()
+    if cache is None:
+        return
+    
+    try:
+        current = cache.get(pending_until_key(doctor_id))
+        if current is not None and date_time.timestamp() < current:
+            cache.set(pending_until_key(doctor_id), date_time.timestamp(), settings.DASHBOARD_COUNTER_TTL)
+    except CACHE_ERRORS as e:
+        logger.warning('Cache compartilhado indisponível (%s): próxima pendente não atualizada', e)
+
+
+def invalidate_recent(doctor_ids):
+    delete_keys(recent_key(doctor_id) for doctor_id in doctor_ids if doctor_id is not None)
+
+
+# Reconciliação
+
+def reconcile_counters(doctor_ids=None):
+    """
+    Recalcula os contadores de todos os médicos com três consultas agrupadas
+    e corrige o cache; retorna quantos valores estavam divergentes
+    (sempre 0 sem cache compartilhado: o dashboard lê direto do banco)
+    """
+    from django.contrib.auth.models import User
+    
+    cache = shared_cache()
+    if cache is None:
+        return 0
+    
+    if doctor_ids is None:
+        doctor_ids = list(User.objects.values_list('id', flat=True))
+    
+    now = timezone.now()
+    today = timezone.localdate(now)
+    
+    patients = count_active_patients(doctor_ids)
+    appointments = count_appointments_on(doctor_ids, today)
+    pending = count_pending(doctor_ids, now)
+    
+    expected = {}
+    for doctor_id in doctor_ids:
+        total, pending_until = pending.get(doctor_id, (0, math.inf))
+        expected[patients_key(doctor_id)] = patients.get(doctor_id, 0)
+        expected[appointments_key(doctor_id, today)] = appointments.get(doctor_id, 0)
+        expected[pending_key(doctor_id)] = total
+        expected[pending_until_key(doctor_id)] = pending_until
+    
+    current = cache.get_many(list(expected))
+    drift = sum(
+        1 for key, value in expected.items()
+        if key in current and current[key] != value and not key.endswith('pending-until')
+    )
+    
+    cache.set_many(expected, settings.DASHBOARD_COUNTER_TTL)
+    return drift
@@ -0,0 +1,19 @@
+# api/renderers.py
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Permite negociar text/event-stream (EventSource).
+    O corpo do streaming é gerado pela view; aqui só são renderizados erros.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return f"event: error\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
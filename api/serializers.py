@@ -1,5 +1,9 @@
 # api/serializers.py
-from rest_framework import serializers
+from contextlib import contextmanager
+from datetime import timedelta
+from rest_framework import exceptions, serializers, status
+from django.db import IntegrityError, transaction
+from django.db.models import Max
 from django.contrib.auth.models import User
 from patients.models import Patient, MedicalRecord, Prescription
 from appointments.models import Appointment 
@@ -16,6 +20,8 @@ class UserSerializer(serializers.ModelSerializer):
 class PatientSerializer(serializers.ModelSerializer):
     age = serializers.SerializerMethodField()
     total_appointments = serializers.SerializerMethodField()
+    total_records = serializers.SerializerMethodField()
+    last_visit = serializers.SerializerMethodField()
     full_address = serializers.SerializerMethodField()
     
     class Meta:
@@ -26,7 +32,7 @@ class PatientSerializer(serializers.ModelSerializer):
             'street', 'number', 'complement', 'neighborhood', 'city', 'state', 'zipcode',
             'full_address', 'blood_type', 'allergies',
             'chronic_conditions', 'created_at', 'updated_at',
-            'total_appointments'
+            'total_appointments', 'total_records', 'last_visit'
         ]
         read_only_fields = ['created_at', 'updated_at']
     
@@ -35,9 +41,27 @@ class PatientSerializer(serializers.ModelSerializer):
         today = date.today()
         return (today - obj.birth_date).days // 365
     
+    # Os agregados abaixo vêm anotados por PatientViewSet.with_stats; fora
+    # dele (p.ex. resposta de create/update) são consultados por paciente
     def get_total_appointments(self, obj):
+        if hasattr(obj, 'total_appointments'):
+            return obj.total_appointments
         return obj.appointments.count()
     
+    def get_total_records(self, obj):
+        if hasattr(obj, 'total_records'):
+            return obj.total_records
+        return obj.records.count()
+    
+    def get_last_visit(self, obj):
+        if hasattr(obj, 'last_visit'):
+            last_visit = obj.last_visit
+        else:
+            last_visit = obj.appointments.filter(status='completed').aggregate(
+                last=Max('date_time')
+            )['last']
+        return serializers.DateTimeField().to_representation(last_visit) if last_visit else None
+    
     def get_full_address(self, obj):
         address_parts = [
             obj.street,
@@ -85,6 +109,22 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
         return None
 
 
+class AppointmentConflict(exceptions.APIException):
+    """
+    409 com os ids das consultas em conflito; uma ValidationError
+    converteria os ids em texto
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'appointment_conflict'
+    
+    def __init__(self, conflicts):
+        super().__init__()
+        self.detail = {
+            'date_time': ['O médico já possui consulta neste horário'],
+            'conflicting_appointments': conflicts,
+        }
+
+
 class AppointmentSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.full_name', read_only=True)
     doctor_name = serializers.CharField(source='doctor.get_full_name', read_only=True)
@@ -102,12 +142,71 @@ class AppointmentSerializer(serializers.ModelSerializer):
     
     def validate_date_time(self, value):
         """Valida se a data/hora é futura"""
-        from datetime import datetime
-        if value < datetime.now():
+        from django.utils import timezone
+        if value < timezone.now():
             raise serializers.ValidationError(
                 "Não é possível agendar consultas no passado"
             )
         return value
+    
+    def validate_duration_minutes(self, value):
+        """Valida a duração: a busca de conflitos assume no máximo Appointment.MAX_DURATION"""
+        max_minutes = int(Appointment.MAX_DURATION.total_seconds() // 60)
+        if not 0 < value <= max_minutes:
+            raise serializers.ValidationError(
+                f"A duração deve estar entre 1 e {max_minutes} minutos"
+            )
+        return value
+    
+    def validate(self, attrs):
+        """Impede que o médico tenha duas consultas no mesmo horário"""
+        if attrs.get('status', getattr(self.instance, 'status', None)) == 'cancelled':
+            return attrs
+        
+        doctor_id = self.instance.doctor_id if self.instance else self.context['request'].user.id
+        conflicts = self._conflicting_ids(doctor_id, attrs)
+        if conflicts:
+            self._raise_conflict(conflicts)
+        
+        return attrs
+    
+    def create(self, validated_data):
+        with self._overlap_guard(validated_data):
+            return super().create(validated_data)
+    
+    def update(self, instance, validated_data):
+        with self._overlap_guard(validated_data):
+            return super().update(instance, validated_data)
+    
+    @contextmanager
+    def _overlap_guard(self, validated_data):
+        """
+        Gravações simultâneas podem passar juntas pela validação; no PostgreSQL
+        a exclusion constraint rejeita a segunda sem bloquear a agenda inteira
+        """
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError as e:
+            if Appointment.OVERLAP_CONSTRAINT not in str(e):
+                raise
+            doctor = validated_data.get('doctor')
+            doctor_id = doctor.id if doctor else self.instance.doctor_id
+            self._raise_conflict(self._conflicting_ids(doctor_id, validated_data))
+    
+    def _conflicting_ids(self, doctor_id, data):
+        instance = self.instance
+        start = data.get('date_time', getattr(instance, 'date_time', None))
+        duration = data.get('duration_minutes', getattr(instance, 'duration_minutes', 30))
+        
+        conflicts = Appointment.conflicts(
+            doctor_id, start, start + timedelta(minutes=duration),
+            exclude_id=instance.pk if instance else None
+        )
+        return list(conflicts.order_by('date_time').values_list('id', flat=True))
+    
+    def _raise_conflict(self, conflicts):
+        raise AppointmentConflict(conflicts)
 
 
 class AIConversationSerializer(serializers.ModelSerializer):
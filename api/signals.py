@@ -0,0 +1,107 @@
+# api/signals.py
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from appointments.models import Appointment
+from patients.models import Patient, MedicalRecord, Prescription
+from . import dashboard
+
+
+APPOINTMENT_FIELDS = ('doctor_id', 'date_time', 'status')
+PATIENT_FIELDS = ('doctor_id', 'is_active')
+
+
+def _state(instance, fields):
+    return tuple(instance.__dict__.get(field) for field in fields)
+
+
+def _on_commit_changes(old, new, pending=None):
+    """Contadores aplicados só após o commit: um rollback não deixa resíduo"""
+    def apply():
+        dashboard.apply_changes(old, new)
+        if pending is not None:
+            dashboard.lower_pending_until(*pending)
+    
+    if settings.SHARED_CACHE_ENABLED and (old != new or pending is not None):
+        transaction.on_commit(apply)
+
+
+def _invalidate_recent_on_commit(doctor_id):
+    if settings.SHARED_CACHE_ENABLED:
+        transaction.on_commit(lambda: dashboard.invalidate_recent([doctor_id]))
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_state(sender, instance, **kwargs):
+    instance._dashboard_state = _state(instance, APPOINTMENT_FIELDS) if instance.pk else None
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, **kwargs):
+    now = timezone.now()
+    state = _state(instance, APPOINTMENT_FIELDS)
+    old = dashboard.appointment_counters(None if created else instance._dashboard_state, now)
+    new = dashboard.appointment_counters(state, now)
+    
+    pending = None
+    if dashboard.pending_key(instance.doctor_id) in new - old:
+        pending = (instance.doctor_id, instance.date_time)
+    
+    _on_commit_changes(old, new, pending)
+    instance._dashboard_state = state
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    now = timezone.now()
+    _on_commit_changes(dashboard.appointment_counters(instance._dashboard_state, now), Counter())
+
+
+@receiver(post_init, sender=Patient)
+def remember_patient_state(sender, instance, **kwargs):
+    instance._dashboard_state = _state(instance, PATIENT_FIELDS) if instance.pk else None
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, created, **kwargs):
+    state = _state(instance, PATIENT_FIELDS)
+    old = dashboard.patient_counters(None if created else instance._dashboard_state)
+    _on_commit_changes(old, dashboard.patient_counters(state))
+    
+    # O nome do paciente aparece nos prontuários recentes
+    if not created:
+        _invalidate_recent_on_commit(instance.doctor_id)
+    
+    instance._dashboard_state = state
+
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    _on_commit_changes(dashboard.patient_counters(instance._dashboard_state), Counter())
+    _invalidate_recent_on_commit(instance.doctor_id)
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def record_changed(sender, instance, **kwargs):
+    _invalidate_recent_on_commit(instance.doctor_id)
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+def prescription_changed(sender, instance, **kwargs):
+    if not settings.SHARED_CACHE_ENABLED:
+        return
+    
+    record_id = instance.medical_record_id
+    
+    def invalidate():
+        doctor_ids = MedicalRecord.objects.filter(pk=record_id).values_list('doctor_id', flat=True)
+        dashboard.invalidate_recent(list(doctor_ids))
+    
+    transaction.on_commit(invalidate)
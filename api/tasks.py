@@ -0,0 +1,15 @@
+# api/tasks.py
+import logging
+
+from celery import shared_task
+
+
+@shared_task(ignore_result=True)
+def reconcile_dashboard_counters():
+    """Corrige os contadores do dashboard (escritas em lote não disparam signals)"""
+    from .dashboard import reconcile_counters
+    
+    drift = reconcile_counters()
+    if drift:
+        logging.getLogger(__name__).info('Dashboard: %s contadores corrigidos na reconciliação', drift)
+    return drift
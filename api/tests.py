@@ -1,3 +1,403 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ai_assistant import services
+from appointments.models import Appointment
+from patients.models import Patient, MedicalRecord
+
+
+def with_shared_cache(backend, **options):
+    return {**settings.CACHES, 'shared': {'BACKEND': backend, **options}}
+
+
+LOCMEM_SHARED_CACHES = with_shared_cache(
+    'django.core.cache.backends.locmem.LocMemCache', LOCATION='medicai-tests-shared'
+)
+
+
+def process_caches(name):
+    """Cache default próprio de um processo e o cache compartilhado dos testes"""
+    return override_settings(CACHES={
+        **LOCMEM_SHARED_CACHES,
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'process-{name}'},
+    })
+
+
+# Sem o registro de uso em segundo plano (a thread gravaria no banco de teste)
+# e sem chave da API: a IA roda em modo mock mesmo com ANTHROPIC_API_KEY no .env
+@override_settings(
+    CACHES=LOCMEM_SHARED_CACHES, SHARED_CACHE_ENABLED=True, AI_LOG_ENABLED=False, ANTHROPIC_API_KEY=''
+)
+class ApiTestCase(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        # O assistente compartilhado lê a chave ao ser criado
+        self.enterContext(mock.patch.object(services, '_assistant', None))
+        self.doctor = User.objects.create_user('doctor', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def create_patient(self, index, **fields):
+        data = {
+            'doctor': self.doctor,
+            'full_name': f'Paciente {index}',
+            'cpf': f'000.000.000-{index:02d}',
+            'birth_date': date(1970, 1, 1) + timedelta(days=365 * index),
+            'gender': 'MF'[index % 2],
+            'phone': '11999999999',
+            'street': 'Rua A',
+            'number': '1',
+            'neighborhood': 'Centro',
+            'city': 'São Paulo',
+            'state': 'SP',
+            'zipcode': '01000-000',
+        }
+        data.update(fields)
+        return Patient.objects.create(**data)
+
+    def create_appointment(self, patient, date_time, **fields):
+        data = {'patient': patient, 'doctor': self.doctor, 'date_time': date_time, 'appointment_type': 'Consulta'}
+        data.update(fields)
+        return Appointment.objects.create(**data)
+
+    def create_record(self, patient, **fields):
+        data = {
+            'patient': patient,
+            'doctor': self.doctor,
+            'complaint': 'Cefaleia',
+            'history': '-',
+            'physical_exam': '-',
+            'diagnosis': 'Enxaqueca',
+            'treatment_plan': '-',
+        }
+        data.update(fields)
+        return MedicalRecord.objects.create(**data)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+
+class PatientListQueryTests(ApiTestCase):
+    def create_patients(self, start, count):
+        for index in range(start, start + count):
+            patient = self.create_patient(index)
+            for days in (10, 20):
+                self.create_appointment(
+                    patient, timezone.now() - timedelta(days=days, minutes=index), status='completed'
+                )
+            self.create_record(patient)
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        self.create_patients(0, 2)
+        small, data = self.count_queries('/api/patients/')
+        self.assertEqual(len(data['results']), 2)
+
+        self.create_patients(2, 18)
+        full, data = self.count_queries('/api/patients/')
+        self.assertEqual(len(data['results']), 20)
+
+        self.assertEqual(small, full)
+
+    def test_list_returns_annotated_aggregates(self):
+        patient = self.create_patient(1)
+        last_visit = timezone.now() - timedelta(days=3)
+        self.create_appointment(patient, last_visit, status='completed')
+        self.create_appointment(patient, last_visit - timedelta(days=30), status='completed')
+        self.create_appointment(patient, timezone.now() + timedelta(days=3))
+        self.create_record(patient)
+        self.create_patient(2)
+
+        _, data = self.count_queries('/api/patients/')
+        by_id = {row['id']: row for row in data['results']}
+
+        self.assertEqual(by_id[patient.id]['total_appointments'], 3)
+        self.assertEqual(by_id[patient.id]['total_records'], 1)
+        self.assertEqual(
+            by_id[patient.id]['last_visit'],
+            timezone.localtime(last_visit).isoformat()
+        )
+        self.assertEqual(
+            [row['total_appointments'] for row in data['results'] if row['id'] != patient.id], [0]
+        )
+
+    def test_detail_matches_unannotated_serializer(self):
+        from api.serializers import PatientSerializer
+
+        self.create_patients(0, 1)
+        patient = Patient.objects.get()
+
+        queries, data = self.count_queries(f'/api/patients/{patient.id}/')
+
+        self.assertEqual(queries, 1)
+        self.assertEqual(data, PatientSerializer(patient).data)
+
+
+class MedicalRecordQueryBudgetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.create_patient(1)
+
+    def create_records(self, count):
+        for index in range(count):
+            record = self.create_record(self.patient)
+            for name in ('Dipirona', 'Losartana'):
+                record.prescriptions.create(
+                    medication_name=name, dosage='1 cp', frequency='8/8h', duration=f'{index + 1} dias'
+                )
+
+    def test_list_query_budget(self):
+        self.create_records(2)
+        small, data = self.count_queries('/api/records/')
+        self.assertEqual(len(data['results']), 2)
+
+        self.create_records(18)
+        full, data = self.count_queries('/api/records/')
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(len(data['results'][0]['prescriptions']), 2)
+
+        # COUNT da paginação, prontuários com paciente/médico e prescrições
+        self.assertEqual(small, 3)
+        self.assertEqual(full, 3)
+
+    def test_detail_query_budget(self):
+        self.create_records(1)
+        record = MedicalRecord.objects.get()
+
+        queries, data = self.count_queries(f'/api/records/{record.id}/')
+
+        self.assertEqual(queries, 2)
+        self.assertEqual(data['patient_name'], 'Paciente 1')
+        self.assertEqual(
+            [item['medication_name'] for item in data['prescriptions']], ['Dipirona', 'Losartana']
+        )
+
+    def test_dashboard_query_budget(self):
+        self.create_records(8)
+
+        queries, data = self.count_queries('/api/dashboard/overview/')
+
+        # Primeira leitura: três contagens, prontuários recentes e prescrições
+        self.assertEqual(queries, 5)
+        self.assertEqual(len(data['recent_consultations']), 5)
+
+        # Depois, apenas leituras de cache
+        queries, _ = self.count_queries('/api/dashboard/overview/')
+        self.assertEqual(queries, 0)
+
+
+class DashboardCounterTests(ApiTestCase):
+    def overview(self, queries=0, **headers):
+        with self.assertNumQueries(queries):
+            return self.client.get('/api/dashboard/overview/', **headers)
+
+    def test_counters_follow_patient_and_appointment_writes(self):
+        self.client.get('/api/dashboard/overview/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = self.create_patient(1)
+            inactive = self.create_patient(2, is_active=False)
+            later = self.create_appointment(patient, timezone.now() + timedelta(days=2))
+            self.create_appointment(patient, timezone.now() + timedelta(days=3), status='confirmed')
+
+        data = self.overview().json()
+        self.assertEqual(data['total_patients'], 1)
+        self.assertEqual(data['pending_appointments'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            later.status = 'cancelled'
+            later.save()
+            inactive.is_active = True
+            inactive.save()
+            self.create_appointment(patient, timezone.now() + timedelta(minutes=5))
+
+        # Alterar o paciente invalida só os prontuários recentes
+        data = self.overview(queries=1).json()
+        self.assertEqual(data['total_patients'], 2)
+        self.assertEqual(data['pending_appointments'], 1)
+        self.assertEqual(
+            data['appointments_today'],
+            Appointment.objects.filter(doctor=self.doctor, date_time__date=timezone.localdate()).count()
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.delete()
+
+        data = self.overview(queries=1).json()
+        self.assertEqual(
+            (data['total_patients'], data['pending_appointments'], data['appointments_today']), (1, 0, 0)
+        )
+
+    def test_reconciliation_corrects_bulk_writes(self):
+        from api.dashboard import reconcile_counters
+
+        patient = self.create_patient(1)
+        self.client.get('/api/dashboard/overview/')
+
+        # bulk_create não dispara signals
+        start = timezone.now() + timedelta(days=1)
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=patient, doctor=self.doctor, date_time=start + timedelta(hours=hours),
+                end_time=start + timedelta(hours=hours, minutes=30), appointment_type='Consulta'
+            )
+            for hours in range(3)
+        ])
+        self.assertEqual(self.overview().json()['pending_appointments'], 0)
+
+        self.assertEqual(reconcile_counters([self.doctor.id]), 1)
+        self.assertEqual(self.overview().json()['pending_appointments'], 3)
+
+    def test_unchanged_dashboard_returns_not_modified(self):
+        first = self.client.get('/api/dashboard/overview/')
+        etag = first['ETag']
+
+        response = self.overview(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_record(self.create_patient(1))
+
+        response = self.client.get('/api/dashboard/overview/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['recent_consultations']), 1)
+
+
+class DashboardWithoutSharedCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.create_patient(1)
+        self.create_appointment(self.patient, timezone.now() + timedelta(days=1))
+        self.create_record(self.patient)
+
+    def assert_counters(self, expected):
+        # Três contagens, prontuários recentes e prescrições a cada leitura
+        with self.assertNumQueries(5):
+            data = self.client.get('/api/dashboard/overview/').json()
+        self.assertEqual(
+            (data['total_patients'], data['pending_appointments'], len(data['recent_consultations'])), expected
+        )
+
+    @override_settings(
+        CACHES=with_shared_cache('django.core.cache.backends.dummy.DummyCache'), SHARED_CACHE_ENABLED=False
+    )
+    def test_disabled_cache_computes_overview_directly(self):
+        from api.dashboard import reconcile_counters
+
+        self.assert_counters((1, 1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_appointment(self.patient, timezone.now() + timedelta(days=2))
+            self.create_record(self.patient)
+
+        self.assert_counters((1, 2, 2))
+        self.assertEqual(reconcile_counters([self.doctor.id]), 0)
+
+    @override_settings(CACHES=with_shared_cache(
+        'django.core.cache.backends.redis.RedisCache', LOCATION='redis://127.0.0.1:1',
+        OPTIONS={'socket_connect_timeout': 0.1, 'socket_timeout': 0.1}
+    ))
+    def test_unreachable_redis_falls_back_to_database(self):
+        with self.assertLogs('core.shared_cache', 'WARNING'), self.assertLogs('api.dashboard', 'WARNING'):
+            self.assert_counters((1, 1, 1))
+
+        with self.assertLogs('api.dashboard', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_appointment(self.patient, timezone.now() + timedelta(days=2))
+
+        with self.assertLogs('core.shared_cache', 'WARNING'), self.assertLogs('api.dashboard', 'WARNING'):
+            self.assert_counters((1, 2, 1))
+
+
+class AsyncAIJobTests(ApiTestCase):
+    def test_broker_outage_falls_back_to_synchronous_response(self):
+        from kombu.exceptions import OperationalError
+
+        from ai_assistant.tasks import differential_diagnosis_task
+
+        patient = self.create_patient(1)
+        outage = mock.patch.object(
+            differential_diagnosis_task, 'apply_async', side_effect=OperationalError('connection refused')
+        )
+
+        with outage, self.assertLogs('api.views', 'WARNING'):
+            response = self.client.post(
+                '/api/records/ai_assist/?async=1', {'symptoms': 'febre', 'patient_id': patient.id}, format='json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('job_id', response.json())
+
+    def test_job_status_is_only_visible_to_its_owner(self):
+        from types import SimpleNamespace
+
+        from django.contrib.auth.models import User
+
+        from ai_assistant.tasks import differential_diagnosis_task
+
+        patient = self.create_patient(1)
+        # Sem atributo status: o enfileiramento não pode consultar o backend
+        enqueue = mock.patch.object(
+            differential_diagnosis_task, 'apply_async',
+            side_effect=lambda args, task_id, retry: SimpleNamespace(id=task_id)
+        )
+
+        with enqueue:
+            response = self.client.post(
+                '/api/records/ai_assist/?async=1', {'symptoms': 'febre', 'patient_id': patient.id}, format='json'
+            )
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'PENDING')
+
+        pending = SimpleNamespace(status='STARTED', successful=lambda: False, failed=lambda: False)
+        with mock.patch('api.views.AsyncResult', return_value=pending) as backend:
+            self.assertEqual(self.client.get(job['status_url']).json()['status'], 'STARTED')
+
+            self.client.force_authenticate(User.objects.create_user('other', password='secret'))
+            self.assertEqual(self.client.get(job['status_url']).status_code, 404)
+            self.assertEqual(self.client.get('/api/ai-jobs/0123-abcd/').status_code, 404)
+        self.assertEqual(backend.call_count, 1)
+
+
+class HealthSummaryStreamTests(ApiTestCase):
+    def test_stream_summarizes_most_recent_records_in_order(self):
+        import json
+
+        patient = self.create_patient(1)
+        now = timezone.now()
+        for index in range(7):
+            record = self.create_record(patient, diagnosis=f'Diagnóstico {index}')
+            MedicalRecord.objects.filter(id=record.id).update(created_at=now - timedelta(days=7 - index))
+
+        with mock.patch('ai_assistant.services.time.sleep'):
+            response = self.client.get(
+                f'/api/patients/{patient.id}/health_summary_stream/', HTTP_ACCEPT='text/event-stream'
+            )
+            body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        *events, done, tail = body.split('\n\n')
+        self.assertEqual((done, tail), ('event: done\ndata: {}', ''))
+        self.assertGreater(len(events), 1)
+        text = ''
+        for event in events:
+            self.assertTrue(event.startswith('data: '), event)
+            text += json.loads(event[len('data: '):])['text']
+
+        self.assertIn('HISTÓRICO: 5 consulta(s)', text)
+        self.assertIn('Diagnósticos prévios: Diagnóstico 2, Diagnóstico 3, Diagnóstico 4', text)
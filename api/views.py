@@ -2,14 +2,103 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Q
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.db.models import Count
 from datetime import datetime, timedelta
-from patients.models import Patient, MedicalRecord
+from patients.models import Patient, MedicalRecord, Prescription
 from appointments.models import Appointment
 from .serializers import PatientSerializer, MedicalRecordSerializer, AppointmentSerializer
-from ai_assistant.services import MedicalAIAssistant, PredictiveAnalytics
-import pandas as pd
+from .renderers import EventStreamRenderer
+from ai_assistant.services import (
+    get_ai_assistant, PredictiveAnalytics, SmartScheduling, OverbookingPlanner, DiagnosisCache,
+    semantic_cache_stats, SUMMARY_INITIAL_RECORDS
+)
+from ai_assistant.tasks import differential_diagnosis_task, medical_summary_task
+from celery.result import AsyncResult
+from rest_framework.reverse import reverse
+from kombu.exceptions import OperationalError
+from medicAI.celery import app as celery_app
+import json
+import logging
+import uuid
+
+
+def _wants_async(request):
+    """Modo assíncrono opcional via ?async=1"""
+    return request.query_params.get('async', '').lower() in ('1', 'true')
+
+
+def _enqueue_ai_job(request, task, *args):
+    """
+    Enfileira tarefa de IA no Celery e retorna dados para acompanhamento;
+    None com o broker indisponível (a view segue pelo caminho síncrono)
+    """
+    try:
+        job = task.apply_async(
+            args=[request.user.id, *args], task_id=_new_job_id(request.user.id), retry=False
+        )
+    except OperationalError:
+        logging.getLogger(__name__).warning(
+            'Broker indisponível; executando %s de forma síncrona', task.name
+        )
+        return None
+    return {
+        'job_id': job.id,
+        # Recém-enfileirada: consultar o backend de resultados só custaria uma ida ao Redis
+        'status': 'PENDING',
+        'status_url': reverse('ai-job-detail', args=[job.id], request=request),
+    }
+
+
+def _job_signature(user_id, task_id):
+    return salted_hmac('api.ai-job', f'{user_id}:{task_id}').hexdigest()[:16]
+
+
+def _new_job_id(user_id):
+    """Id da tarefa assinado com o médico: a posse é conferida sem consultar o backend"""
+    task_id = str(uuid.uuid4())
+    return f'{task_id}-{_job_signature(user_id, task_id)}'
+
+
+def _is_job_owner(user_id, job_id):
+    task_id, _, signature = job_id.rpartition('-')
+    return constant_time_compare(signature, _job_signature(user_id, task_id))
+
+
+def _sse_events(chunks):
+    """Formata partes de texto como eventos Server-Sent Events"""
+    for chunk in chunks:
+        yield f"data: {json.dumps({'text': chunk}, ensure_ascii=False)}\n\n"
+    yield "event: done\ndata: {}\n\n"
+
+
+async def _iterate_in_thread(iterator):
+    """Consome um iterador bloqueante em thread, sem bufferizar a resposta no ASGI"""
+    sentinel = object()
+    while True:
+        chunk = await sync_to_async(next, thread_sensitive=False)(iterator, sentinel)
+        if chunk is sentinel:
+            return
+        yield chunk
+
+
+def _event_stream_response(request, chunks):
+    events = _sse_events(chunks)
+    
+    # No ASGI o Django só envia partes incrementalmente com iteradores assíncronos
+    if isinstance(request._request, ASGIRequest):
+        events = _iterate_in_thread(events)
+    
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 class PatientViewSet(viewsets.ModelViewSet):
@@ -17,7 +106,33 @@ class PatientViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Patient.objects.filter(doctor=self.request.user, is_active=True)
+        patients = Patient.objects.filter(doctor=self.request.user, is_active=True)
+        if self.action in ('list', 'retrieve', 'health_summary'):
+            patients = self.with_stats(patients)
+        return patients
+    
+    @staticmethod
+    def with_stats(patients):
+        """
+        Agregados lidos pelo PatientSerializer como subconsultas correlacionadas:
+        a página inteira sai de uma única consulta, sem COUNT por paciente
+        """
+        from django.db.models import Max, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+        
+        def count(model, **filters):
+            rows = model.objects.filter(patient=OuterRef('pk'), **filters).order_by().values('patient')
+            return Coalesce(Subquery(rows.annotate(total=Count('pk')).values('total')), 0)
+        
+        completed = Appointment.objects.filter(
+            patient=OuterRef('pk'), status='completed'
+        ).order_by().values('patient')
+        
+        return patients.annotate(
+            total_appointments=count(Appointment),
+            total_records=count(MedicalRecord),
+            last_visit=Subquery(completed.annotate(last=Max('date_time')).values('last')),
+        )
     
     def perform_create(self, serializer):
         serializer.save(doctor=self.request.user)
@@ -55,9 +170,41 @@ class PatientViewSet(viewsets.ModelViewSet):
             vitals_history
         )
         
-        # Gerar resumo com IA
-        ai = MedicalAIAssistant()
-        records_data = [
+        response_data = {
+            'patient': PatientSerializer(patient).data,
+            'risk_analysis': risk_analysis,
+            'ai_summary': None,
+            'total_consultations': records.count(),
+            'last_visit': records.first().created_at if records.exists() else None
+        }
+        
+        if _wants_async(request):
+            job = _enqueue_ai_job(request, medical_summary_task, patient.id)
+            if job is not None:
+                response_data['ai_job'] = job
+                return Response(response_data, status=status.HTTP_202_ACCEPTED)
+        
+        # Resumo com IA: persistido e atualizado só com prontuários novos
+        ai = get_ai_assistant()
+        response_data['ai_summary'] = ai.get_rolling_summary(patient, user_id=request.user.id)
+        
+        return Response(response_data)
+    
+    @action(detail=True, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def health_summary_stream(self, request, pk=None):
+        """Resumo clínico de IA transmitido via Server-Sent Events"""
+        patient = self.get_object()
+        # Os mais recentes, em ordem cronológica (o prompt usa os últimos da lista)
+        recent = patient.records.order_by('-created_at', '-id')[:SUMMARY_INITIAL_RECORDS]
+        records_data = self._records_data(reversed(recent))
+        
+        ai = get_ai_assistant()
+        return _event_stream_response(request, ai.stream_medical_summary(
+            records_data, user_id=request.user.id, patient_id=patient.id
+        ))
+    
+    def _records_data(self, records):
+        return [
             {
                 'date': r.created_at.strftime('%Y-%m-%d'),
                 'complaint': r.complaint,
@@ -65,53 +212,68 @@ class PatientViewSet(viewsets.ModelViewSet):
             }
             for r in records
         ]
-        summary = ai.generate_medical_summary(records_data)
+    
+    @action(detail=False, methods=['get'])
+    def high_risk(self, request):
+        """Pacientes do médico ordenados por score de risco (cálculo em lote)"""
+        import pandas as pd
+        from django.db.models import OuterRef, Subquery
         
-        return Response({
-            'patient': PatientSerializer(patient).data,
-            'risk_analysis': risk_analysis,
-            'ai_summary': summary,
-            'total_consultations': records.count(),
-            'last_visit': records.first().created_at if records.exists() else None
-        })
+        try:
+            min_score = int(request.query_params.get('min_score', 60))
+        except ValueError:
+            return Response(
+                {'error': 'min_score deve ser um número inteiro'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Sinais vitais do prontuário mais recente com peso registrado
+        latest = MedicalRecord.objects.filter(
+            patient=OuterRef('pk'), weight__isnull=False
+        ).order_by('-created_at')
+        
+        fields = ['id', 'full_name', 'birth_date', 'chronic_conditions',
+                  'blood_pressure_sys', 'weight', 'height']
+        rows = self.get_queryset().annotate(
+            blood_pressure_sys=Subquery(latest.values('blood_pressure_sys')[:1]),
+            weight=Subquery(latest.values('weight')[:1]),
+            height=Subquery(latest.values('height')[:1]),
+        ).values_list(*fields)
+        
+        panel = pd.DataFrame.from_records(list(rows), columns=fields)
+        if panel.empty:
+            return Response([])
+        
+        panel['age'] = PredictiveAnalytics.ages_from_birth_dates(panel['birth_date'])
+        
+        scores = PredictiveAnalytics.calculate_health_risk_scores(panel)
+        panel = panel.join(scores)
+        panel = panel[panel['total_score'] >= min_score].sort_values(
+            ['total_score', 'full_name'], ascending=[False, True]
+        )
+        
+        return Response([
+            {
+                'id': row.id,
+                'full_name': row.full_name,
+                'age': int(row.age),
+                'total_score': int(row.total_score),
+                'risk_level': row.risk_level,
+                'factors': {
+                    'age': int(row.age_risk),
+                    'chronic_conditions': int(row.chronic_risk),
+                    'vitals': int(row.vitals_risk),
+                },
+            }
+            for row in panel.itertuples(index=False)
+        ])
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Estatísticas gerais de pacientes"""
-        patients = self.get_queryset()
+        """Estatísticas gerais de pacientes (uma consulta agregada, em cache por médico)"""
+        from patients.stats import get_patient_stats
         
-        return Response({
-            'total_patients': patients.count(),
-            'active_patients': patients.filter(is_active=True).count(),
-            'gender_distribution': {
-                'male': patients.filter(gender='M').count(),
-                'female': patients.filter(gender='F').count(),
-                'other': patients.filter(gender='O').count(),
-            },
-            'age_groups': self._get_age_distribution(patients),
-            'patients_with_chronic': patients.exclude(chronic_conditions='').count()
-        })
-    
-    def _get_age_distribution(self, patients):
-        from datetime import date
-        today = date.today()
-        
-        distribution = {'0-18': 0, '19-35': 0, '36-50': 0, '51-65': 0, '65+': 0}
-        
-        for p in patients:
-            age = (today - p.birth_date).days // 365
-            if age <= 18:
-                distribution['0-18'] += 1
-            elif age <= 35:
-                distribution['19-35'] += 1
-            elif age <= 50:
-                distribution['36-50'] += 1
-            elif age <= 65:
-                distribution['51-65'] += 1
-            else:
-                distribution['65+'] += 1
-        
-        return distribution
+        return Response(get_patient_stats(request.user.id))
 
 
 class MedicalRecordViewSet(viewsets.ModelViewSet):
@@ -119,7 +281,19 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return MedicalRecord.objects.filter(doctor=self.request.user)
+        return self.with_details(MedicalRecord.objects.filter(doctor=self.request.user))
+    
+    @staticmethod
+    def with_details(records):
+        """
+        Paciente, médico e prescrições lidos pelo MedicalRecordSerializer:
+        uma consulta para os prontuários (com JOIN) e uma para as prescrições
+        """
+        from django.db.models import Prefetch
+        
+        return records.select_related('patient', 'doctor').prefetch_related(
+            Prefetch('prescriptions', queryset=Prescription.objects.order_by('created_at', 'id'))
+        )
     
     def perform_create(self, serializer):
         serializer.save(doctor=self.request.user)
@@ -155,11 +329,34 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             'allergies': patient.allergies
         }
         
+        if _wants_async(request):
+            job = _enqueue_ai_job(request, differential_diagnosis_task, symptoms, patient_data, patient.id)
+            if job is not None:
+                return Response(job, status=status.HTTP_202_ACCEPTED)
+        
         # Obter sugestões da IA
-        ai = MedicalAIAssistant()
-        suggestions = ai.get_differential_diagnosis(symptoms, patient_data)
+        ai = get_ai_assistant()
+        suggestions = ai.get_differential_diagnosis(
+            symptoms, patient_data, user_id=request.user.id, patient_id=patient.id
+        )
         
         return Response(suggestions)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def ai_cache_stats(self, request):
+        """Taxa de acerto dos caches de diagnóstico e tempo de busca no índice"""
+        return Response({
+            'exact': DiagnosisCache.stats(),
+            'semantic': semantic_cache_stats(),
+        })
+    
+    @action(detail=True, methods=['post'])
+    def check_interactions(self, request, pk=None):
+        """Verifica interações entre todas as prescrições do prontuário"""
+        record = self.get_object()
+        
+        ai = get_ai_assistant()
+        return Response(ai.check_record_interactions(record, user_id=request.user.id))
 
 
 class AppointmentViewSet(viewsets.ModelViewSet):
@@ -198,77 +395,123 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(appointments, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def suggest_slots(self, request):
+        """
+        Próximos horários livres do médico que comportam a consulta
+        (?duration=30&priority=high|normal|low&count=5&days=30)
+        """
+        try:
+            duration = int(request.query_params.get('duration', 30))
+            count = int(request.query_params.get('count', 5))
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response(
+                {'error': 'duration, count e days devem ser números inteiros'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not (0 < duration <= 480 and 0 < count <= 50 and 0 < days <= 366):
+            return Response(
+                {'error': 'Valores fora do intervalo permitido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        suggestion = SmartScheduling.suggest_optimal_appointment_time(
+            request.user.id,
+            request.query_params.get('priority', 'normal'),
+            duration_minutes=duration,
+            count=count,
+            days=days
+        )
+        return Response(suggestion)
+    
     @action(detail=True, methods=['post'])
     def predict_no_show(self, request, pk=None):
         """Prediz probabilidade de não comparecimento"""
         appointment = self.get_object()
         
-        # Calcular dias até a consulta
-        days_until = (appointment.date_time.date() - datetime.now().date()).days
+        # Mesmos atributos da predição em lote (e do treino do modelo)
+        appointment_data = PredictiveAnalytics.no_show_frame([appointment]).iloc[0].to_dict()
         
-        # Buscar histórico de não comparecimentos
-        previous_no_shows = Appointment.objects.filter(
-            patient=appointment.patient,
-            status='no_show'
-        ).count()
+        probability = PredictiveAnalytics.predict_appointment_no_show(appointment_data)
         
-        appointment_data = {
-            'days_until': days_until,
-            'previous_no_shows': previous_no_shows,
-            'hour': appointment.date_time.hour,
-            'is_first': appointment.patient.appointments.count() == 1
-        }
+        return Response(self._no_show_result(appointment, probability))
+    
+    @action(detail=False, methods=['get'])
+    def predict_no_show_batch(self, request):
+        """
+        Probabilidade de não comparecimento de todas as próximas consultas
+        do período (?start=AAAA-MM-DD&end=AAAA-MM-DD, padrão: próximos 7 dias)
+        """
+        from datetime import date, time
+        
+        today = timezone.localdate()
+        try:
+            start = date.fromisoformat(request.query_params.get('start', today.isoformat()))
+            end = date.fromisoformat(request.query_params.get('end', (today + timedelta(days=7)).isoformat()))
+        except ValueError:
+            return Response(
+                {'error': 'Datas devem estar no formato AAAA-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        probability = PredictiveAnalytics.predict_appointment_no_show(appointment_data)
+        period_start = max(timezone.now(), timezone.make_aware(datetime.combine(start, time.min)))
+        period_end = timezone.make_aware(datetime.combine(end, time.max))
         
-        return Response({
+        appointments = list(
+            self.get_queryset().filter(
+                date_time__gte=period_start,
+                date_time__lte=period_end,
+                status__in=['scheduled', 'confirmed']
+            ).select_related('patient').order_by('date_time')
+        )
+        if not appointments:
+            return Response([])
+        
+        frame = PredictiveAnalytics.no_show_frame(appointments, today)
+        
+        probabilities = PredictiveAnalytics.predict_no_show_batch(frame)
+        
+        return Response([
+            dict(self._no_show_result(appointment, float(probability)), date_time=appointment.date_time)
+            for appointment, probability in zip(appointments, probabilities)
+        ])
+    
+    @action(detail=False, methods=['get'])
+    def overbooking(self, request):
+        """
+        Encaixes extras recomendados por bloco do expediente, considerando a
+        probabilidade de falta das consultas marcadas (?date=AAAA-MM-DD, padrão: hoje)
+        """
+        from datetime import date
+        
+        try:
+            day = date.fromisoformat(request.query_params.get('date', timezone.localdate().isoformat()))
+        except ValueError:
+            return Response(
+                {'error': 'Data deve estar no formato AAAA-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        plan, = OverbookingPlanner.plan_day(day, [request.user.id])
+        return Response(plan)
+    
+    def _no_show_result(self, appointment, probability):
+        return {
             'appointment_id': appointment.id,
             'patient': appointment.patient.full_name,
             'no_show_probability': round(probability * 100, 2),
             'risk_level': 'Alto' if probability > 0.5 else 'Médio' if probability > 0.3 else 'Baixo',
             'recommendation': 'Enviar lembrete' if probability > 0.3 else 'Acompanhamento normal'
-        })
+        }
     
     @action(detail=False, methods=['get'])
     def analytics(self, request):
-        """Analytics de consultas"""
-        appointments = self.get_queryset()
-        
-        # Últimos 30 dias
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        recent = appointments.filter(date_time__gte=thirty_days_ago)
-        
-        return Response({
-            'total_appointments': appointments.count(),
-            'last_30_days': recent.count(),
-            'by_status': {
-                'completed': recent.filter(status='completed').count(),
-                'scheduled': recent.filter(status='scheduled').count(),
-                'cancelled': recent.filter(status='cancelled').count(),
-                'no_show': recent.filter(status='no_show').count(),
-            },
-            'no_show_rate': self._calculate_no_show_rate(recent),
-            'busiest_hours': self._get_busiest_hours(recent),
-            'average_duration': recent.aggregate(avg=models.Avg('duration_minutes'))['avg']
-        })
-    
-    def _calculate_no_show_rate(self, appointments):
-        total = appointments.exclude(status='scheduled').count()
-        if total == 0:
-            return 0
-        no_shows = appointments.filter(status='no_show').count()
-        return round((no_shows / total) * 100, 2)
-    
-    def _get_busiest_hours(self, appointments):
-        from django.db.models.functions import ExtractHour
-        
-        hours = appointments.annotate(
-            hour=ExtractHour('date_time')
-        ).values('hour').annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
+        """Analytics de consultas (uma consulta agregada + horários de pico, em cache por médico)"""
+        from appointments.stats import get_appointment_analytics
         
-        return list(hours)
+        return Response(get_appointment_analytics(request.user.id))
 
 
 class DashboardView(viewsets.ViewSet):
@@ -277,35 +520,54 @@ class DashboardView(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def overview(self, request):
-        """Visão geral do dashboard"""
+        """
+        Visão geral do dashboard: contadores mantidos em cache pelos signals
+        (api/signals.py) e prontuários recentes em cache. Responde 304 quando
+        o conteúdo não mudou desde o ETag enviado em If-None-Match
+        """
+        from . import dashboard
+        
         user = request.user
         
-        # Pacientes
-        total_patients = Patient.objects.filter(doctor=user, is_active=True).count()
+        def load_recent():
+            recent_records = MedicalRecordViewSet.with_details(
+                MedicalRecord.objects.filter(doctor=user)
+            ).order_by('-created_at')[:5]
+            return list(MedicalRecordSerializer(recent_records, many=True).data)
         
-        # Consultas
-        today = datetime.now().date()
-        appointments_today = Appointment.objects.filter(
-            doctor=user,
-            date_time__date=today
-        ).count()
+        payload = dashboard.get_counters(user.id)
+        payload['recent_consultations'] = dashboard.get_recent_records(user.id, load_recent)
         
-        # Consultas pendentes
-        pending_appointments = Appointment.objects.filter(
-            doctor=user,
-            date_time__gte=datetime.now(),
-            status='scheduled'
-        ).count()
+        etag = dashboard.etag_for(payload)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(dict(payload, timestamp=datetime.now().isoformat()))
         
-        # Últimos registros médicos
-        recent_records = MedicalRecord.objects.filter(
-            doctor=user
-        ).order_by('-created_at')[:5]
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class AIJobViewSet(viewsets.ViewSet):
+    """Status e resultado das tarefas assíncronas de IA"""
+    permission_classes = [IsAuthenticated]
+    lookup_value_regex = '[0-9a-f-]+'
+    
+    def retrieve(self, request, pk=None):
+        # Status e resultado só para o médico que criou a tarefa
+        if not _is_job_owner(request.user.id, pk):
+            return Response(
+                {'error': 'Tarefa não encontrada'},
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        return Response({
-            'total_patients': total_patients,
-            'appointments_today': appointments_today,
-            'pending_appointments': pending_appointments,
-            'recent_consultations': MedicalRecordSerializer(recent_records, many=True).data,
-            'timestamp': datetime.now().isoformat()
-        })
\ No newline at end of file
+        job = AsyncResult(pk, app=celery_app)
+        response_data = {'job_id': pk, 'status': job.status, 'result': None}
+        
+        if job.successful():
+            response_data['result'] = job.result['result']
+        elif job.failed():
+            response_data['error'] = 'Não foi possível concluir a análise de IA'
+        
+        return Response(response_data)
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def fill_end_time(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    
+    batch = []
+    for appointment in Appointment.objects.only('date_time', 'duration_minutes').iterator(chunk_size=2000):
+        appointment.end_time = appointment.date_time + timedelta(minutes=appointment.duration_minutes)
+        batch.append(appointment)
+        if len(batch) >= 2000:
+            Appointment.objects.bulk_update(batch, ['end_time'])
+            batch = []
+    
+    if batch:
+        Appointment.objects.bulk_update(batch, ['end_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='end_time',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_end_time, migrations.RunPython.noop),
+    ]
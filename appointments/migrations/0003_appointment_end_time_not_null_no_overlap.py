@@ -0,0 +1,80 @@
+from django.core.management.base import CommandError
+from django.db import migrations, models
+
+
+# Pares de consultas ativas do mesmo médico que se sobrepõem; com qualquer um
+# deles o ADD CONSTRAINT abortaria com um erro genérico do PostgreSQL
+OVERLAPS_SQL = """
+    SELECT a.doctor_id, a.id, b.id
+    FROM appointments_appointment a
+    JOIN appointments_appointment b
+      ON b.doctor_id = a.doctor_id AND b.id > a.id
+     AND b.date_time < a.end_time AND a.date_time < b.end_time
+    WHERE a.status <> 'cancelled' AND b.status <> 'cancelled'
+    ORDER BY a.doctor_id, a.id, b.id
+"""
+
+MAX_REPORTED_OVERLAPS = 20
+
+
+def check_existing_overlaps(schema_editor):
+    """Falha com a lista das sobreposições, que precisam ser resolvidas antes"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(OVERLAPS_SQL)
+        overlaps = cursor.fetchall()
+    
+    if not overlaps:
+        return
+    
+    pairs = '\n'.join(
+        f'  médico {doctor_id}: consultas {first} e {second}'
+        for doctor_id, first, second in overlaps[:MAX_REPORTED_OVERLAPS]
+    )
+    if len(overlaps) > MAX_REPORTED_OVERLAPS:
+        pairs += f'\n  ... e mais {len(overlaps) - MAX_REPORTED_OVERLAPS}'
+    raise CommandError(
+        f'{len(overlaps)} pares de consultas ativas se sobrepõem e impedem a '
+        f'constraint appointments_no_overlap:\n{pairs}\n'
+        'Remarque ou cancele (status "cancelled") uma consulta de cada par e '
+        'rode o migrate novamente.'
+    )
+
+
+def add_overlap_constraint(apps, schema_editor):
+    # Exclusion constraint depende de GiST (btree_gist); em outros bancos a
+    # checagem fica só na validação da API
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    
+    check_existing_overlaps(schema_editor)
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        "ALTER TABLE appointments_appointment ADD CONSTRAINT appointments_no_overlap "
+        "EXCLUDE USING gist (doctor_id WITH =, tstzrange(date_time, end_time, '[)') WITH &&) "
+        "WHERE (status <> 'cancelled')"
+    )
+
+
+def drop_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    
+    schema_editor.execute(
+        'ALTER TABLE appointments_appointment DROP CONSTRAINT IF EXISTS appointments_no_overlap'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_appointment_end_time'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='end_time',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.RunPython(add_overlap_constraint, drop_overlap_constraint),
+    ]
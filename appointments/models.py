@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from django.db import models
 from patients.models import User, Patient, MedicalRecord
 
@@ -16,6 +18,8 @@ class Appointment(models.Model):
     
     date_time = models.DateTimeField()
     duration_minutes = models.IntegerField(default=30)
+    # Calculado em save(): date_time + duration_minutes (base das checagens de conflito)
+    end_time = models.DateTimeField(editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
     
     appointment_type = models.CharField(max_length=100)
@@ -35,6 +39,36 @@ class Appointment(models.Model):
             models.Index(fields=['patient', 'date_time']),
         ]
     
+    # Nenhuma consulta dura mais que isso: limita a busca de conflitos no índice
+    MAX_DURATION = timedelta(hours=24)
+    
+    # Exclusion constraint criada apenas no PostgreSQL (migração 0003)
+    OVERLAP_CONSTRAINT = 'appointments_no_overlap'
+    
     def __str__(self):
         return f"{self.patient.full_name} - {self.date_time}"
+    
+    def save(self, *args, **kwargs):
+        self.end_time = self.date_time + timedelta(minutes=self.duration_minutes)
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'date_time', 'duration_minutes'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'end_time'}
+        
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def conflicts(cls, doctor_id, start, end, exclude_id=None):
+        """Consultas não canceladas do médico que se sobrepõem a [start, end)"""
+        overlapping = cls.objects.filter(
+            doctor_id=doctor_id,
+            date_time__gte=start - cls.MAX_DURATION,
+            date_time__lt=end,
+            end_time__gt=start,
+        ).exclude(status='cancelled')
+        
+        if exclude_id is not None:
+            overlapping = overlapping.exclude(pk=exclude_id)
+        
+        return overlapping
 
@@ -0,0 +1,32 @@
+# appointments/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Appointment
+from .stats import invalidate_appointment_analytics
+
+
+@receiver(post_init, sender=Appointment)
+def remember_analytics_doctor(sender, instance, **kwargs):
+    instance._analytics_doctor_id = instance.__dict__.get('doctor_id')
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, **kwargs):
+    # Uma troca de médico altera as analytics dos dois
+    _invalidate_analytics({instance.doctor_id, instance._analytics_doctor_id})
+    instance._analytics_doctor_id = instance.doctor_id
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    _invalidate_analytics({instance.doctor_id})
+
+
+def _invalidate_analytics(doctor_ids):
+    def invalidate():
+        for doctor_id in doctor_ids - {None}:
+            invalidate_appointment_analytics(doctor_id)
+    
+    transaction.on_commit(invalidate)
@@ -0,0 +1,72 @@
+# appointments/stats.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, Q
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from core.shared_cache import delete_keys, get_or_compute
+
+
+ANALYTICS_KEY_PREFIX = 'appointment-analytics'
+
+STATUSES = ('completed', 'scheduled', 'cancelled', 'no_show')
+
+
+def compute_appointment_analytics(appointments, now=None):
+    """
+    Analytics do conjunto de consultas: totais, status e duração média dos
+    últimos 30 dias em uma única consulta agregada, mais os horários de pico
+    """
+    now = now or timezone.now()
+    recent = Q(date_time__gte=now - timedelta(days=30))
+    
+    totals = appointments.aggregate(
+        total_appointments=Count('id'),
+        last_30_days=Count('id', filter=recent),
+        # Base da taxa de faltas: consultas do período já resolvidas
+        settled=Count('id', filter=recent & ~Q(status='scheduled')),
+        average_duration=Avg('duration_minutes', filter=recent),
+        **{status: Count('id', filter=recent & Q(status=status)) for status in STATUSES}
+    )
+    
+    busiest_hours = appointments.filter(recent).annotate(
+        hour=ExtractHour('date_time')
+    ).values('hour').annotate(
+        count=Count('id')
+    ).order_by('-count', 'hour')[:5]
+    
+    settled = totals['settled']
+    return {
+        'total_appointments': totals['total_appointments'],
+        'last_30_days': totals['last_30_days'],
+        'by_status': {status: totals[status] for status in STATUSES},
+        'no_show_rate': round(totals['no_show'] / settled * 100, 2) if settled else 0,
+        'busiest_hours': list(busiest_hours),
+        'average_duration': totals['average_duration'],
+    }
+
+
+def analytics_cache_key(doctor_id):
+    return f'{ANALYTICS_KEY_PREFIX}:{doctor_id}'
+
+
+def get_appointment_analytics(doctor_id):
+    """
+    Analytics das consultas do médico no cache compartilhado, invalidadas
+    pelos signals de Appointment. A janela de 30 dias anda sem que nenhuma
+    linha mude, e update/bulk_create não disparam signals: esses casos ficam
+    defasados por até APPOINTMENT_ANALYTICS_CACHE_TTL segundos
+    """
+    from .models import Appointment
+    
+    return get_or_compute(
+        analytics_cache_key(doctor_id),
+        lambda: compute_appointment_analytics(Appointment.objects.filter(doctor_id=doctor_id)),
+        settings.APPOINTMENT_ANALYTICS_CACHE_TTL
+    )
+
+
+def invalidate_appointment_analytics(doctor_id):
+    delete_keys([analytics_cache_key(doctor_id)])
@@ -1,3 +1,105 @@
-from django.test import TestCase
+import importlib
+from datetime import timedelta
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from api.tests import ApiTestCase
+from appointments.models import Appointment
+from appointments.stats import get_appointment_analytics
+
+
+class AppointmentAnalyticsCacheTests(ApiTestCase):
+    def test_analytics_are_invalidated_by_appointment_writes(self):
+        patient = self.create_patient(1)
+        appointment = self.create_appointment(patient, timezone.now() - timedelta(days=1), status='completed')
+
+        self.assertEqual(get_appointment_analytics(self.doctor.id)['by_status']['completed'], 1)
+        with self.assertNumQueries(0):
+            get_appointment_analytics(self.doctor.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'no_show'
+            appointment.save()
+
+        analytics = get_appointment_analytics(self.doctor.id)
+        self.assertEqual(analytics['by_status']['no_show'], 1)
+        self.assertEqual(analytics['no_show_rate'], 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+
+        self.assertEqual(get_appointment_analytics(self.doctor.id)['total_appointments'], 0)
+
+
+class AppointmentOverlapTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.create_patient(1)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=2)
+
+    def book(self, offset_minutes, **fields):
+        data = {
+            'patient': self.patient.id,
+            'date_time': (self.start + timedelta(minutes=offset_minutes)).isoformat(),
+            'appointment_type': 'Consulta',
+        }
+        data.update(fields)
+        return self.client.post('/api/appointments/', data, format='json')
+
+    def test_create_rejects_overlapping_appointment(self):
+        first = self.book(0, duration_minutes=60).json()['id']
+
+        response = self.book(30)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflicting_appointments'], [first])
+
+        # Termina exatamente quando a próxima começa
+        self.assertEqual(self.book(60).status_code, 201)
+
+    def test_update_rejects_overlap_and_ignores_cancelled(self):
+        first = self.book(0, duration_minutes=60).json()['id']
+        second = self.book(60).json()['id']
+
+        response = self.client.patch(f'/api/appointments/{first}/', {'duration_minutes': 90}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflicting_appointments'], [second])
+
+        response = self.client.patch(f'/api/appointments/{first}/', {'duration_minutes': 45}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Appointment.objects.get(id=first).end_time, self.start + timedelta(minutes=45))
+
+        self.client.patch(f'/api/appointments/{second}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(self.book(60).status_code, 201)
+
+    def test_duration_must_fit_conflict_window(self):
+        for duration in (0, -30, 24 * 60 + 1):
+            response = self.book(0, duration_minutes=duration)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('duration_minutes', response.json())
+
+        first = self.book(0, duration_minutes=24 * 60).json()['id']
+
+        # Uma consulta de 24 h ainda é encontrada pela busca de conflitos
+        response = self.book(23 * 60)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflicting_appointments'], [first])
+
+        response = self.client.patch(f'/api/appointments/{first}/', {'duration_minutes': 0}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_migration_reports_existing_overlaps(self):
+        migration = importlib.import_module('appointments.migrations.0003_appointment_end_time_not_null_no_overlap')
+        schema_editor = SimpleNamespace(connection=connection)
+
+        first = self.create_appointment(self.patient, self.start, duration_minutes=60)
+        self.create_appointment(self.patient, self.start + timedelta(minutes=60))
+        cancelled = self.create_appointment(self.patient, self.start + timedelta(minutes=30), status='cancelled')
+        migration.check_existing_overlaps(schema_editor)
+
+        cancelled.status = 'scheduled'
+        cancelled.save()
+        with self.assertRaisesMessage(CommandError, f'consultas {first.id} e {cancelled.id}'):
+            migration.check_existing_overlaps(schema_editor)
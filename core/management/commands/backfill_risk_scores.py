@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from patients.models import Patient
+from patients.tasks import recompute_risk_scores
+
+
+class Command(BaseCommand):
+    help = 'Calcula ai_risk_score de todo o histórico de prontuários, em lotes de pacientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Pacientes processados por lote')
+        parser.add_argument('--doctor', type=int, help='Limita a um médico (id)')
+
+    def handle(self, *args, **options):
+        patients = Patient.objects.order_by('pk')
+        if options['doctor']:
+            patients = patients.filter(doctor_id=options['doctor'])
+
+        chunk_size = options['chunk_size']
+        last_pk = 0
+        processed = updated = 0
+
+        # Paginação por chave: cada lote é uma consulta indexada, sem OFFSET
+        while True:
+            ids = list(patients.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+
+            updated += recompute_risk_scores(ids)
+            processed += len(ids)
+            last_pk = ids[-1]
+
+            self.stdout.write(f'{processed} pacientes processados, {updated} scores atualizados')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Concluído: {processed} pacientes, {updated} scores atualizados'
+        ))
@@ -0,0 +1,107 @@
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+import ai_assistant.services as services
+
+
+class _FakeAnthropicHandler(BaseHTTPRequestHandler):
+    """Servidor local que imita POST /v1/messages da API Anthropic"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+
+        body = json.dumps({
+            'id': 'msg_bench',
+            'type': 'message',
+            'role': 'assistant',
+            'model': 'claude-sonnet-4-20250514',
+            'content': [{'type': 'text', 'text': 'Resumo clínico de benchmark.'}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {'input_tokens': 120, 'output_tokens': 12},
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compara latência p50/p99 do cliente Anthropic por requisição vs. compartilhado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--warmup', type=int, default=10)
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeAnthropicHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        records = [
+            {'date': '2025-01-10', 'complaint': 'Cefaleia', 'diagnosis': 'Enxaqueca'},
+        ]
+
+        try:
+            with override_settings(ANTHROPIC_API_KEY='sk-ant-bench', ANTHROPIC_BASE_URL=base_url):
+                services._assistant = None
+
+                per_request = self._run(
+                    lambda: services.MedicalAIAssistant().generate_medical_summary(records),
+                    options['requests'], options['warmup']
+                )
+                shared = self._run(
+                    lambda: services.get_ai_assistant().generate_medical_summary(records),
+                    options['requests'], options['warmup']
+                )
+
+                services._assistant = None
+        finally:
+            server.shutdown()
+
+        self.stdout.write(f"Servidor local: {base_url} ({options['requests']} requisições)")
+        self._report('Por requisição', per_request)
+        self._report('Compartilhado', shared)
+
+        p50_gain = 1 - statistics.median(shared) / statistics.median(per_request)
+        p99_gain = 1 - self._p99(shared) / self._p99(per_request)
+        self.stdout.write(self.style.SUCCESS(
+            f'Redução de latência: p50 {p50_gain:.1%} | p99 {p99_gain:.1%}'
+        ))
+
+    def _run(self, call, requests, warmup):
+        for _ in range(warmup):
+            call()
+
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    @staticmethod
+    def _p99(timings):
+        return statistics.quantiles(timings, n=100)[98]
+
+    def _report(self, label, timings):
+        self.stdout.write(
+            f'{label:<16} p50 {statistics.median(timings):7.2f} ms | '
+            f'p99 {self._p99(timings):7.2f} ms | '
+            f'média {statistics.mean(timings):7.2f} ms'
+        )
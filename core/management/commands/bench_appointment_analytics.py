@@ -0,0 +1,110 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Avg, Count
+from django.db.models.functions import ExtractHour
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from appointments.models import Appointment
+from appointments.stats import compute_appointment_analytics
+from patients.models import Patient
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compara o analytics de consultas (consultas separadas vs. agregação única) em uma tabela sintética'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Tudo dentro de uma transação desfeita ao final: nada fica no banco
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        doctor = User.objects.create_user(f'bench-analytics-{time.time_ns()}')
+        patient = Patient.objects.create(
+            doctor=doctor, full_name='Paciente Benchmark', cpf=f'bench-{time.time_ns()}',
+            birth_date=date(1980, 1, 1), gender='O', phone='-', street='-', number='-',
+            neighborhood='-', city='-', state='SP', zipcode='-'
+        )
+
+        now = timezone.now()
+        statuses = ('completed', 'completed', 'completed', 'scheduled', 'cancelled', 'no_show')
+        started = time.perf_counter()
+        for offset in range(0, options['rows'], 10_000):
+            batch = []
+            for _ in range(min(10_000, options['rows'] - offset)):
+                date_time = now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+                duration = rng.choice((30, 30, 45, 60))
+                batch.append(Appointment(
+                    patient=patient, doctor=doctor, date_time=date_time, duration_minutes=duration,
+                    end_time=date_time + timedelta(minutes=duration), status=rng.choice(statuses),
+                    appointment_type='Consulta',
+                ))
+            Appointment.objects.bulk_create(batch)
+        self.stdout.write(
+            f"{options['rows']} consultas criadas em {time.perf_counter() - started:.1f} s "
+            f'({connection.vendor})'
+        )
+
+        appointments = Appointment.objects.filter(doctor=doctor)
+        legacy, legacy_queries = self._measure(lambda: self._legacy(appointments, now), options['repeat'])
+        single, single_queries = self._measure(
+            lambda: compute_appointment_analytics(appointments, now), options['repeat']
+        )
+
+        self.stdout.write(f'Consultas separadas: {legacy:8.1f} ms ({legacy_queries} consultas)')
+        self.stdout.write(f'Agregação única:     {single:8.1f} ms ({single_queries} consultas)')
+        self.stdout.write(self.style.SUCCESS(f'Ganho: {legacy / single:.1f}x'))
+
+    def _measure(self, compute, repeat):
+        # Contador próprio: o log de consultas do DEBUG já está cheio após a carga
+        executed = []
+
+        def count(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        timings = []
+        with connection.execute_wrapper(count):
+            for _ in range(repeat):
+                started = time.perf_counter()
+                compute()
+                timings.append((time.perf_counter() - started) * 1000)
+        return min(timings), len(executed) // repeat
+
+    @staticmethod
+    def _legacy(appointments, now):
+        """Implementação anterior: uma consulta por métrica"""
+        recent = appointments.filter(date_time__gte=now - timedelta(days=30))
+        settled = recent.exclude(status='scheduled').count()
+        return {
+            'total_appointments': appointments.count(),
+            'last_30_days': recent.count(),
+            'by_status': {
+                status: recent.filter(status=status).count()
+                for status in ('completed', 'scheduled', 'cancelled', 'no_show')
+            },
+            'no_show_rate': recent.filter(status='no_show').count() / settled if settled else 0,
+            'busiest_hours': list(
+                recent.annotate(hour=ExtractHour('date_time')).values('hour')
+                .annotate(count=Count('id')).order_by('-count')[:5]
+            ),
+            'average_duration': recent.aggregate(avg=Avg('duration_minutes'))['avg'],
+        }
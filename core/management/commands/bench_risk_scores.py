@@ -0,0 +1,78 @@
+import random
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from ai_assistant.services import PredictiveAnalytics
+
+
+CONDITIONS = [
+    '', '', '', 'Diabetes tipo 2', 'Hipertensão', 'Hipertensão, diabetes',
+    'Cardiopatia isquêmica', 'Asma', 'Câncer de mama (em remissão)', 'DPOC',
+]
+
+
+class Command(BaseCommand):
+    help = 'Mede o cálculo vetorizado de risco e compara com o cálculo individual'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100_000)
+        parser.add_argument('--check', type=int, default=5_000,
+                            help='Pacientes comparados com o cálculo individual')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        panel = self._panel(options['patients'], options['seed'])
+
+        start = time.perf_counter()
+        scores = PredictiveAnalytics.calculate_health_risk_scores(panel)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{len(panel)} pacientes em {elapsed * 1000:.1f} ms "
+            f"({scores['risk_level'].value_counts().to_dict()})"
+        )
+
+        sample = panel.head(options['check'])
+        start = time.perf_counter()
+        mismatches = sum(
+            self._scalar(row) != (scores.at[idx, 'total_score'], scores.at[idx, 'risk_level'])
+            for idx, row in zip(sample.index, sample.to_dict('records'))
+        )
+        scalar_elapsed = (time.perf_counter() - start) / max(len(sample), 1) * len(panel)
+
+        self.stdout.write(f'Cálculo individual (estimado): {scalar_elapsed * 1000:.1f} ms')
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'{mismatches} divergência(s) em {len(sample)} pacientes'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Resultados idênticos em {len(sample)} pacientes'))
+
+    def _scalar(self, row):
+        vitals = {
+            key: row[key] for key in ('blood_pressure_sys', 'weight', 'height')
+            if not pd.isna(row[key])
+        }
+        result = PredictiveAnalytics.calculate_health_risk_score(
+            {'age': row['age'], 'chronic_conditions': row['chronic_conditions']},
+            [vitals] if vitals else []
+        )
+        return result['total_score'], result['risk_level']
+
+    def _panel(self, size, seed):
+        rng = np.random.default_rng(seed)
+        random.seed(seed)
+
+        panel = pd.DataFrame({
+            'age': rng.integers(0, 95, size),
+            'chronic_conditions': [random.choice(CONDITIONS) for _ in range(size)],
+            'blood_pressure_sys': rng.integers(80, 180, size).astype(float),
+            'weight': np.round(rng.uniform(40, 130, size), 2),
+            'height': np.round(rng.uniform(1.45, 2.0, size), 2),
+        })
+
+        # Pacientes sem sinais vitais registrados
+        missing = rng.random(size) < 0.15
+        panel.loc[missing, ['blood_pressure_sys', 'weight', 'height']] = np.nan
+        return panel
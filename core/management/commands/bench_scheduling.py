@@ -0,0 +1,60 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ai_assistant.services import BusyCalendar, SmartScheduling
+
+
+class Command(BaseCommand):
+    help = 'Mede a busca de horários livres em uma agenda sintética de um ano'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--occupancy', type=float, default=0.9,
+                            help='Fração dos horários da grade já ocupados')
+        parser.add_argument('--count', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        start = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+        end = start + timedelta(days=365)
+
+        calendars, appointments, build_ms = [], 0, 0.0
+        for _ in range(options['doctors']):
+            booked = [
+                (slot, rng.choice((30, 30, 30, 60)))
+                for slot in SmartScheduling.free_slots(BusyCalendar(), start, end)
+                if rng.random() < options['occupancy']
+            ]
+            appointments += len(booked)
+
+            build_start = time.perf_counter()
+            calendars.append(BusyCalendar.from_appointments(booked))
+            build_ms += (time.perf_counter() - build_start) * 1000 / options['doctors']
+
+        timings = []
+        for calendar in calendars:
+            query_start = time.perf_counter()
+            SmartScheduling.rank_slots(calendar, rng.choice(['high', 'normal', 'low']), start, end,
+                                       count=options['count'])
+            timings.append((time.perf_counter() - query_start) * 1000)
+
+        # Pior caso: agenda lotada, a busca percorre o ano inteiro
+        full = BusyCalendar([(start, end)])
+        full_start = time.perf_counter()
+        SmartScheduling.rank_slots(full, 'normal', start, end, count=options['count'])
+        full_ms = (time.perf_counter() - full_start) * 1000
+
+        timings.sort()
+        self.stdout.write(
+            f"{options['doctors']} médicos, {appointments} consultas em 1 ano "
+            f"(montagem da agenda: {build_ms:.2f} ms/médico)"
+        )
+        self.stdout.write(
+            f'Sugestões: p50 {timings[len(timings) // 2]:.2f} ms | máx {timings[-1]:.2f} ms | '
+            f'agenda lotada (ano inteiro): {full_ms:.2f} ms'
+        )
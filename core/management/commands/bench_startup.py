@@ -0,0 +1,92 @@
+import json
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Módulos que não devem ser carregados na inicialização dos workers
+HEAVY_MODULES = ('numpy', 'pandas', 'sklearn', 'scipy', 'anthropic', 'httpx', 'joblib')
+
+STARTUP_SCRIPT = """
+import json, resource, sys
+import {module}
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({{
+    'heavy': [name for name in {heavy!r} if name in sys.modules],
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Mede a inicialização a frio (python -X importtime) de medicAI.wsgi + URLs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='medicAI.wsgi')
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--top', type=int, default=10, help='Pacotes mais lentos listados')
+
+    def handle(self, *args, **options):
+        script = STARTUP_SCRIPT.format(module=options['module'], heavy=HEAVY_MODULES)
+
+        totals, rss = [], []
+        by_package = defaultdict(list)
+        heavy = set()
+
+        for _ in range(options['runs']):
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', script],
+                cwd=settings.BASE_DIR, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                raise CommandError(result.stderr.strip().splitlines()[-1])
+
+            total, packages = self._parse(result.stderr)
+            totals.append(total)
+            for package, self_us in packages.items():
+                by_package[package].append(self_us)
+
+            info = json.loads(result.stdout.strip().splitlines()[-1])
+            heavy.update(info['heavy'])
+            rss.append(info['max_rss_kb'] / 1024)
+
+        self.stdout.write(
+            f"{options['module']}: importação {statistics.median(totals) / 1000:.1f} ms "
+            f"(mediana de {options['runs']}), RSS {statistics.median(rss):.1f} MB"
+        )
+
+        slowest = sorted(by_package.items(), key=lambda item: -statistics.median(item[1]))
+        for package, timings in slowest[:options['top']]:
+            self.stdout.write(f'  {package:<24} {statistics.median(timings) / 1000:8.1f} ms')
+
+        if heavy:
+            self.stdout.write(self.style.WARNING(
+                f"Carregados na inicialização: {', '.join(sorted(heavy))}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Nenhuma biblioteca pesada carregada na inicialização'
+            ))
+
+    def _parse(self, stderr):
+        """Soma o tempo próprio (self) por pacote raiz e o tempo total de importação"""
+        total = 0
+        packages = defaultdict(int)
+
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            packages[name.strip().split('.')[0]] += int(self_us)
+
+            # Linhas sem recuo extra são importações de nível superior
+            if not name.startswith('  '):
+                total += int(cumulative_us)
+
+        return total, packages
@@ -0,0 +1,49 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ai_assistant.services import OverbookingPlanner
+
+
+class Command(BaseCommand):
+    help = 'Recomenda encaixes extras (overbooking) do dia para todos os médicos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Dia (AAAA-MM-DD, padrão: hoje)')
+        parser.add_argument('--doctors', help='Ids dos médicos separados por vírgula (padrão: todos com consultas no dia)')
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('Data deve estar no formato AAAA-MM-DD')
+
+        doctor_ids = None
+        if options['doctors']:
+            doctor_ids = [int(value) for value in options['doctors'].split(',')]
+
+        started = time.perf_counter()
+        plans = OverbookingPlanner.plan_day(day, doctor_ids)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        OverbookingPlanner.plan_day(day, doctor_ids)
+        cached = (time.perf_counter() - started) * 1000
+
+        for plan in plans:
+            blocks = ', '.join(
+                f"{timezone.localtime(block['start']):%H:%M} +{block['extra_bookings']}"
+                for block in plan['blocks'] if block['extra_bookings']
+            )
+            self.stdout.write(
+                f"Médico {plan['doctor_id']}: {plan['appointments']} consultas, "
+                f"{plan['expected_no_shows']:.1f} faltas esperadas, "
+                f"{plan['extra_bookings']} encaixes ({plan['overbooking']} acima da capacidade)"
+                + (f" [{blocks}]" if blocks else '')
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(plans)} médicos em {elapsed:.1f} ms (em cache: {cached:.1f} ms)'
+        ))
@@ -0,0 +1,95 @@
+import json
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ai_assistant.services import WaitlistScheduler
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = 'Encaixa uma lista de espera nas agendas dos médicos (guloso + busca local)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', help='Arquivo JSON com a lista de pedidos')
+        parser.add_argument('--synthetic', type=int, help='Gera N pedidos aleatórios')
+        parser.add_argument('--doctors', help='Ids dos médicos separados por vírgula (padrão: todos com pacientes)')
+        parser.add_argument('--days', type=int, default=30, help='Horizonte de agendamento')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--commit', action='store_true', help='Grava as consultas (padrão: simulação)')
+
+    def handle(self, *args, **options):
+        if options['doctors']:
+            doctor_ids = [int(value) for value in options['doctors'].split(',')]
+        else:
+            doctor_ids = list(User.objects.filter(patients__isnull=False).distinct().values_list('id', flat=True))
+        if not doctor_ids:
+            raise CommandError('Nenhum médico informado ou com pacientes cadastrados')
+
+        if options['input']:
+            with open(options['input']) as f:
+                requests = json.load(f)
+            for request in requests:
+                if request.get('earliest'):
+                    request['earliest'] = parse_datetime(request['earliest'])
+        elif options['synthetic']:
+            requests = self._synthetic(options['synthetic'], doctor_ids, options['seed'])
+        else:
+            raise CommandError('Informe --input ou --synthetic')
+
+        start = timezone.now()
+        end = start + timedelta(days=options['days'])
+
+        started = time.perf_counter()
+        scheduler = WaitlistScheduler.for_doctors(doctor_ids, start, end)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        result = scheduler.schedule(requests)
+        timings = result['timings']
+
+        self.stdout.write(
+            f"{len(requests)} pedidos, {len(doctor_ids)} médicos: "
+            f"{len(result['assignments'])} encaixados, {len(result['unassigned'])} sem horário"
+        )
+        self.stdout.write(
+            f"Espera ponderada: guloso {result['greedy_cost']:.0f} -> "
+            f"busca local {result['cost']:.0f} ({result['moves']} movimentos)"
+        )
+        self.stdout.write(
+            f"Tempo: agendas {load_ms:.1f} ms | guloso {timings['greedy_ms']:.1f} ms | "
+            f"busca local {timings['local_search_ms']:.1f} ms"
+        )
+
+        if not options['commit']:
+            self.stdout.write('Simulação: nada gravado (use --commit)')
+            return
+
+        if any(item['patient_id'] is None for item in result['assignments']):
+            raise CommandError('Pedidos sintéticos sem pacientes cadastrados não podem ser gravados')
+
+        started = time.perf_counter()
+        created = WaitlistScheduler.save(result['assignments'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(created)} consultas gravadas em {(time.perf_counter() - started) * 1000:.1f} ms'
+        ))
+
+    def _synthetic(self, size, doctor_ids, seed):
+        rng = random.Random(seed)
+        patients = list(Patient.objects.filter(doctor_id__in=doctor_ids).values_list('id', 'doctor_id'))
+
+        requests = []
+        for _ in range(size):
+            patient_id, doctor_id = rng.choice(patients) if patients else (None, rng.choice(doctor_ids))
+            requests.append({
+                'patient_id': patient_id,
+                'doctor_ids': [doctor_id] if rng.random() < 0.5 else None,
+                'duration_minutes': rng.choice((30, 30, 30, 60)),
+                'priority_score': rng.choice((0, 10, 20, 50, 80, 100)),
+                'appointment_type': 'Consulta',
+            })
+        return requests
@@ -0,0 +1,56 @@
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from ai_assistant.services import PredictiveAnalytics
+from patients.models import MedicalRecord
+
+
+class Command(BaseCommand):
+    help = 'Triagem de tendências de peso e pressão arterial de todos os pacientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, help='Limita a um médico (id)')
+        parser.add_argument('--time-axis', choices=['visit', 'created_at'], default='created_at')
+        parser.add_argument('--window', type=int, default=3)
+        parser.add_argument('--top', type=int, default=20, help='Pacientes listados')
+
+    def handle(self, *args, **options):
+        records = MedicalRecord.objects.filter(patient__is_active=True)
+        if options['doctor']:
+            records = records.filter(doctor_id=options['doctor'])
+
+        start = time.perf_counter()
+        fields = ['patient_id', 'created_at', 'weight', 'blood_pressure_sys']
+        vitals = pd.DataFrame.from_records(
+            list(records.order_by().values_list(*fields)), columns=fields
+        )
+        loaded = time.perf_counter()
+
+        if vitals.empty:
+            self.stdout.write('Nenhum prontuário encontrado')
+            return
+
+        trends = PredictiveAnalytics.analyze_population_trends(
+            vitals, time_axis=options['time_axis'], window=options['window']
+        )
+        elapsed = time.perf_counter()
+
+        flagged = trends[trends['concern']].sort_values('weight_rate', ascending=False)
+
+        self.stdout.write(
+            f'{len(vitals)} prontuários de {len(trends)} pacientes | '
+            f'leitura {loaded - start:.2f}s, análise {elapsed - loaded:.2f}s'
+        )
+        self.stdout.write(
+            f"Atenção: {int(trends['weight_concern'].sum())} por peso, "
+            f"{int(trends['bp_concern'].sum())} por pressão arterial"
+        )
+
+        for patient_id, row in flagged.head(options['top']).iterrows():
+            self.stdout.write(
+                f"  paciente {patient_id}: peso {row['weight_direction'] or '-'} "
+                f"({row['weight_rate']:.2f}), PA média {row['bp_mean']:.0f} "
+                f"± {row['bp_variability']:.0f}"
+            )
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_assistant.no_show import (
+    NoShowModel, build_training_frame, save_artifact, train_no_show_model,
+)
+
+
+class Command(BaseCommand):
+    help = 'Treina o modelo de não comparecimento com o histórico de consultas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-samples', type=int, default=200)
+        parser.add_argument('--n-estimators', type=int, default=100)
+        parser.add_argument('--max-depth', type=int, default=8)
+        parser.add_argument('--min-samples-leaf', type=int, default=20)
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Fração mais recente usada só para validação')
+        parser.add_argument('--output-dir', help='Diretório dos artefatos (padrão: AI_MODELS_DIR)')
+
+    def handle(self, *args, **options):
+        frame = build_training_frame()
+        if len(frame) < options['min_samples']:
+            raise CommandError(
+                f"Histórico insuficiente: {len(frame)} consultas (mínimo {options['min_samples']})"
+            )
+
+        params = {
+            'n_estimators': options['n_estimators'],
+            'max_depth': options['max_depth'],
+            'min_samples_leaf': options['min_samples_leaf'],
+        }
+
+        # Validação temporal: treina no passado, avalia nas consultas mais recentes
+        frame = frame.sort_values('local_time', kind='stable').reset_index(drop=True)
+        split = int(len(frame) * (1 - options['holdout']))
+        metrics = {}
+        if 0 < split < len(frame):
+            metrics = self._evaluate(frame.iloc[:split], frame.iloc[split:], params)
+
+        artifact = train_no_show_model(frame, **params)
+        artifact['metrics'] = metrics
+        path = save_artifact(artifact, options['output_dir'])
+
+        self.stdout.write(f"{len(frame)} consultas, taxa de faltas {frame['no_show'].mean():.1%}")
+        for name, value in metrics.items():
+            self.stdout.write(f'{name}: {value:.4f}')
+        self.stdout.write(f'Latência (1 consulta): {self._latency_ms(path, frame):.3f} ms')
+        self.stdout.write(self.style.SUCCESS(
+            f"Modelo {artifact['version']} salvo em {path} "
+            f"(workers carregam o novo artefato ao reiniciar)"
+        ))
+
+    def _evaluate(self, train, test, params):
+        from sklearn.metrics import brier_score_loss, roc_auc_score
+
+        artifact = train_no_show_model(train, **params)
+        model = NoShowModel(artifact)
+        predicted = model.predict_frame(test)
+        baseline = np.full(len(test), train['no_show'].mean())
+
+        metrics = {
+            'brier': brier_score_loss(test['no_show'], predicted),
+            'brier_baseline': brier_score_loss(test['no_show'], baseline),
+        }
+        if test['no_show'].nunique() == 2:
+            metrics['roc_auc'] = roc_auc_score(test['no_show'], predicted)
+        return metrics
+
+    def _latency_ms(self, path, frame, repeat=1000):
+        from ai_assistant.no_show import load_no_show_model
+
+        model = load_no_show_model(path)
+        row = frame.iloc[-1].to_dict()
+        model.predict(row)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            model.predict(row)
+        return (time.perf_counter() - start) * 1000 / repeat
@@ -0,0 +1,60 @@
+# core/shared_cache.py
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+try:
+    from redis import RedisError
+    CACHE_ERRORS = (RedisError,)
+except ImportError:
+    CACHE_ERRORS = ()
+
+
+logger = logging.getLogger(__name__)
+
+
+def shared_cache():
+    """
+    Cache compartilhado entre processos (SHARED_CACHE_ALIAS), ou None quando
+    desativado: um cache local por processo só seria invalidado no processo
+    que fez a escrita
+    """
+    if not settings.SHARED_CACHE_ENABLED:
+        return None
+    return caches[settings.SHARED_CACHE_ALIAS]
+
+
+def get_or_compute(key, compute, timeout):
+    """Valor em cache ou compute(); sem cache ou com o Redis indisponível, calcula direto"""
+    cache = shared_cache()
+    if cache is None:
+        return compute()
+    
+    try:
+        value = cache.get(key)
+    except CACHE_ERRORS as e:
+        logger.warning('Cache compartilhado indisponível (%s): calculando %s no banco', e, key)
+        return compute()
+    
+    if value is None:
+        value = compute()
+        try:
+            cache.set(key, value, timeout)
+        except CACHE_ERRORS as e:
+            logger.warning('Cache compartilhado indisponível (%s): %s não gravado', e, key)
+    
+    return value
+
+
+def delete_keys(keys):
+    """Remove as chaves; uma falha do Redis fica limitada ao TTL de cada uma"""
+    cache = shared_cache()
+    keys = list(keys)
+    if cache is None or not keys:
+        return
+    
+    try:
+        cache.delete_many(keys)
+    except CACHE_ERRORS as e:
+        logger.warning('Cache compartilhado indisponível (%s): %s não invalidadas', e, keys)
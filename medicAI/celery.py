@@ -19,4 +19,12 @@ app.conf.beat_schedule = {
         'task': 'analytics.tasks.generate_daily_reports',
         'schedule': crontab(hour=23, minute=0),  # 23h diariamente
     },
+    'reconcile-dashboard-counters': {
+        'task': 'api.tasks.reconcile_dashboard_counters',
+        'schedule': crontab(minute='*/15'),  # a cada 15 minutos
+    },
+    'plan-overbooking': {
+        'task': 'ai_assistant.tasks.plan_overbooking_task',
+        'schedule': crontab(hour=6, minute=0),  # 6h diariamente, planos do dia
+    },
 }
\ No newline at end of file
@@ -167,13 +167,123 @@ CORS_ALLOWED_ORIGINS = config(
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Cache
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379')
+
+# Cache compartilhado entre processos (web e Celery): contadores do dashboard
+# e estatísticas por médico. Usa o Redis do Celery, salvo SHARED_CACHE_URL;
+# vazio desativa o cache e os valores são calculados no banco a cada leitura
+SHARED_CACHE_URL = config('SHARED_CACHE_URL', default=REDIS_URL)
+SHARED_CACHE_ENABLED = bool(SHARED_CACHE_URL)
+SHARED_CACHE_ALIAS = 'shared'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'medicai-default',
+    },
+    # Respostas de IA: LocMemCache descarta as entradas menos usadas (LRU)
+    # ao atingir MAX_ENTRIES
+    'ai': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'medicai-ai',
+        'TIMEOUT': config('AI_CACHE_TTL', default=3600, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('AI_CACHE_MAX_ENTRIES', default=1000, cast=int),
+            'CULL_FREQUENCY': config('AI_CACHE_CULL_FREQUENCY', default=10, cast=int),
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': SHARED_CACHE_URL,
+        # Com o Redis fora do ar a leitura cai logo para o banco
+        'OPTIONS': {
+            'socket_connect_timeout': config('SHARED_CACHE_TIMEOUT', default=1.0, cast=float),
+            'socket_timeout': config('SHARED_CACHE_TIMEOUT', default=1.0, cast=float),
+        },
+    } if SHARED_CACHE_ENABLED else {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+
+# AI Assistant
+ANTHROPIC_API_KEY = config('ANTHROPIC_API_KEY', default='')
+ANTHROPIC_BASE_URL = config('ANTHROPIC_BASE_URL', default='')
+AI_CACHE_ALIAS = 'ai'
+
+# Cache semântico (TF-IDF) de diagnóstico diferencial, por médico
+AI_SEMANTIC_CACHE_ENABLED = config('AI_SEMANTIC_CACHE_ENABLED', default=True, cast=bool)
+AI_SEMANTIC_CACHE_THRESHOLD = config('AI_SEMANTIC_CACHE_THRESHOLD', default=0.85, cast=float)
+AI_SEMANTIC_CACHE_MAX_ENTRIES = config('AI_SEMANTIC_CACHE_MAX_ENTRIES', default=500, cast=int)
+AI_SEMANTIC_CACHE_TTL = config('AI_SEMANTIC_CACHE_TTL', default=3600, cast=int)
+
+# Pool HTTP do cliente Anthropic (compartilhado por processo)
+AI_HTTP_MAX_CONNECTIONS = config('AI_HTTP_MAX_CONNECTIONS', default=20, cast=int)
+AI_HTTP_MAX_KEEPALIVE = config('AI_HTTP_MAX_KEEPALIVE', default=10, cast=int)
+AI_HTTP_KEEPALIVE_EXPIRY = config('AI_HTTP_KEEPALIVE_EXPIRY', default=60.0, cast=float)
+AI_HTTP_TIMEOUT = config('AI_HTTP_TIMEOUT', default=60.0, cast=float)
+AI_SUMMARY_MAX_NEW_RECORDS = config('AI_SUMMARY_MAX_NEW_RECORDS', default=10, cast=int)
+
+# Agenda: grade de horários (minutos), expedientes locais e dias úteis (0 = segunda)
+SCHEDULING_SLOT_MINUTES = config('SCHEDULING_SLOT_MINUTES', default=30, cast=int)
+SCHEDULING_WORK_HOURS = config('SCHEDULING_WORK_HOURS', default='08:00-12:00,14:00-18:00')
+SCHEDULING_WORK_DAYS = config('SCHEDULING_WORK_DAYS', default='0,1,2,3,4', cast=lambda v: [int(d) for d in v.split(',')])
+
+# Overbooking: blocos de expediente (minutos), transbordo esperado máximo por
+# bloco (pacientes além da capacidade) e encaixes extras por bloco
+OVERBOOKING_BLOCK_MINUTES = config('OVERBOOKING_BLOCK_MINUTES', default=60, cast=int)
+OVERBOOKING_MAX_OVERFLOW = config('OVERBOOKING_MAX_OVERFLOW', default=0.25, cast=float)
+OVERBOOKING_MAX_EXTRA = config('OVERBOOKING_MAX_EXTRA', default=2, cast=int)
+OVERBOOKING_CACHE_TTL = config('OVERBOOKING_CACHE_TTL', default=86400, cast=int)
+
+# Modelos treinados (artefatos joblib versionados); vazio em
+# AI_NO_SHOW_MODEL_VERSION usa a versão mais recente do diretório
+AI_MODELS_DIR = config('AI_MODELS_DIR', default=str(BASE_DIR / 'ml_models'))
+AI_NO_SHOW_MODEL_VERSION = config('AI_NO_SHOW_MODEL_VERSION', default='')
+
+# Recalculo do ai_risk_score agrupado: alterações do mesmo paciente dentro
+# desta janela (segundos) geram uma única tarefa; a janela fica no cache
+# compartilhado para que o worker a libere
+AI_RISK_SCORE_DEBOUNCE = config('AI_RISK_SCORE_DEBOUNCE', default=10, cast=int)
+
+# Estatísticas de pacientes por médico no cache compartilhado: invalidadas
+# pelos signals de Patient; o TTL cobre alterações em lote (update/bulk_create)
+# sem signals
+PATIENT_STATS_CACHE_TTL = config('PATIENT_STATS_CACHE_TTL', default=3600, cast=int)
+
+# Analytics de consultas por médico no cache compartilhado: invalidadas pelos
+# signals de Appointment; o TTL curto limita a defasagem da janela de 30 dias
+# e de alterações em lote
+APPOINTMENT_ANALYTICS_CACHE_TTL = config('APPOINTMENT_ANALYTICS_CACHE_TTL', default=60, cast=int)
+
+# Dashboard: contadores por médico no cache compartilhado, atualizados pelos
+# signals e corrigidos periodicamente (reconcile_dashboard_counters);
+# prontuários recentes em cache
+DASHBOARD_COUNTER_TTL = config('DASHBOARD_COUNTER_TTL', default=86400, cast=int)
+DASHBOARD_RECENT_TTL = config('DASHBOARD_RECENT_TTL', default=300, cast=int)
+
+# Registro de uso (AIConversation) gravado em lotes por thread em segundo plano
+AI_LOG_ENABLED = config('AI_LOG_ENABLED', default=True, cast=bool)
+AI_LOG_BUFFER_SIZE = config('AI_LOG_BUFFER_SIZE', default=5000, cast=int)
+AI_LOG_BATCH_SIZE = config('AI_LOG_BATCH_SIZE', default=200, cast=int)
+AI_LOG_FLUSH_INTERVAL = config('AI_LOG_FLUSH_INTERVAL', default=5.0, cast=float)
+
+# Coalescência de chamadas idênticas entre processos (vazio = apenas entre threads)
+AI_SINGLEFLIGHT_REDIS_URL = config('AI_SINGLEFLIGHT_REDIS_URL', default='')
+AI_SINGLEFLIGHT_LOCK_TIMEOUT = config('AI_SINGLEFLIGHT_LOCK_TIMEOUT', default=90, cast=int)
+AI_SINGLEFLIGHT_RESULT_TTL = config('AI_SINGLEFLIGHT_RESULT_TTL', default=15, cast=int)
+
+
 # Celery Configuration
-CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379')
-CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_RESULT_EXPIRES = config('AI_JOB_RESULT_TTL', default=3600, cast=int)
 
 
 # Security settings for production
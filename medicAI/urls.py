@@ -3,7 +3,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from api.views import (
     PatientViewSet, MedicalRecordViewSet, 
-    AppointmentViewSet, DashboardView
+    AppointmentViewSet, DashboardView, AIJobViewSet
 )
 
 router = DefaultRouter()
@@ -11,6 +11,7 @@ router.register(r'patients', PatientViewSet, basename='patient')
 router.register(r'records', MedicalRecordViewSet, basename='record')
 router.register(r'appointments', AppointmentViewSet, basename='appointment')
 router.register(r'dashboard', DashboardView, basename='dashboard')
+router.register(r'ai-jobs', AIJobViewSet, basename='ai-job')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -0,0 +1,19 @@
+# Generated by Django 5.0 on 2026-10-18 10:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_remove_patient_address_patient_city_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['doctor', 'ai_risk_score'], name='patients_me_doctor__d1dc61_idx'),
+        ),
+    ]
@@ -79,6 +79,9 @@ class MedicalRecord(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['doctor', 'ai_risk_score']),
+        ]
     
     def __str__(self):
         return f"Prontuário {self.patient.full_name} - {self.created_at.date()}"
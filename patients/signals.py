@@ -0,0 +1,68 @@
+# patients/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Patient, MedicalRecord
+from .stats import invalidate_patient_stats
+from .tasks import schedule_risk_score_update
+
+
+# Campos que alteram o score de risco
+RECORD_RISK_FIELDS = ('blood_pressure_sys', 'weight', 'height')
+PATIENT_RISK_FIELDS = ('birth_date', 'chronic_conditions')
+
+
+def _snapshot(instance, fields):
+    return tuple(instance.__dict__.get(field) for field in fields)
+
+
+@receiver(post_init, sender=MedicalRecord)
+def remember_record_vitals(sender, instance, **kwargs):
+    instance._risk_snapshot = _snapshot(instance, RECORD_RISK_FIELDS)
+
+
+@receiver(post_init, sender=Patient)
+def remember_patient_risk_fields(sender, instance, **kwargs):
+    instance._risk_snapshot = _snapshot(instance, PATIENT_RISK_FIELDS)
+    instance._stats_doctor_id = instance.__dict__.get('doctor_id')
+
+
+@receiver(post_save, sender=MedicalRecord)
+def record_saved(sender, instance, created, **kwargs):
+    current = _snapshot(instance, RECORD_RISK_FIELDS)
+    
+    if created or current != instance._risk_snapshot:
+        patient_id = instance.patient_id
+        transaction.on_commit(lambda: schedule_risk_score_update(patient_id))
+    
+    instance._risk_snapshot = current
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, created, **kwargs):
+    current = _snapshot(instance, PATIENT_RISK_FIELDS)
+    
+    # Paciente novo ainda não tem prontuários
+    if not created and current != instance._risk_snapshot:
+        patient_id = instance.pk
+        transaction.on_commit(lambda: schedule_risk_score_update(patient_id))
+    
+    instance._risk_snapshot = current
+    
+    # Estatísticas do médico atual e do anterior, se o paciente foi transferido
+    _invalidate_stats({instance.doctor_id, instance._stats_doctor_id})
+    instance._stats_doctor_id = instance.doctor_id
+
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    _invalidate_stats({instance.doctor_id})
+
+
+def _invalidate_stats(doctor_ids):
+    def invalidate():
+        for doctor_id in doctor_ids - {None}:
+            invalidate_patient_stats(doctor_id)
+    
+    transaction.on_commit(invalidate)
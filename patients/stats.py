@@ -0,0 +1,87 @@
+# patients/stats.py
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from core.shared_cache import delete_keys, get_or_compute
+
+
+STATS_KEY_PREFIX = 'patient-stats'
+
+# Limite superior (inclusivo) de cada faixa etária; a última é aberta
+AGE_GROUPS = (('0-18', 18), ('19-35', 35), ('36-50', 50), ('51-65', 65), ('65+', None))
+
+
+def stats_cache_key(doctor_id, today=None):
+    # A data entra na chave: as faixas etárias mudam de um dia para o outro
+    return f'{STATS_KEY_PREFIX}:{doctor_id}:{(today or date.today()).isoformat()}'
+
+
+def age_group_filters(today=None):
+    """
+    Faixas etárias como filtros de birth_date. Com idade = (hoje - nascimento).days // 365,
+    idade <= k equivale a nascimento > hoje - 365 * (k + 1) dias
+    """
+    today = today or date.today()
+    filters = {}
+    lower = None
+    
+    for label, upper in AGE_GROUPS:
+        condition = Q()
+        if upper is not None:
+            condition &= Q(birth_date__gt=today - timedelta(days=365 * (upper + 1)))
+        if lower is not None:
+            condition &= Q(birth_date__lte=today - timedelta(days=365 * (lower + 1)))
+        filters[label] = condition
+        lower = upper
+    
+    return filters
+
+
+def compute_patient_stats(patients, today=None):
+    """Estatísticas do conjunto de pacientes em uma única consulta agregada"""
+    age_groups = age_group_filters(today)
+    
+    totals = patients.aggregate(
+        total_patients=Count('id'),
+        active_patients=Count('id', filter=Q(is_active=True)),
+        male=Count('id', filter=Q(gender='M')),
+        female=Count('id', filter=Q(gender='F')),
+        other=Count('id', filter=Q(gender='O')),
+        patients_with_chronic=Count('id', filter=~Q(chronic_conditions='')),
+        **{f'age_{index}': Count('id', filter=condition) for index, condition in enumerate(age_groups.values())}
+    )
+    
+    return {
+        'total_patients': totals['total_patients'],
+        'active_patients': totals['active_patients'],
+        'gender_distribution': {
+            'male': totals['male'],
+            'female': totals['female'],
+            'other': totals['other'],
+        },
+        'age_groups': {label: totals[f'age_{index}'] for index, label in enumerate(age_groups)},
+        'patients_with_chronic': totals['patients_with_chronic'],
+    }
+
+
+def get_patient_stats(doctor_id):
+    """
+    Estatísticas dos pacientes ativos do médico, no cache compartilhado até a
+    próxima alteração de paciente (sem cache compartilhado, calculadas a cada chamada)
+    """
+    from .models import Patient
+    
+    today = date.today()
+    
+    return get_or_compute(
+        stats_cache_key(doctor_id, today),
+        lambda: compute_patient_stats(Patient.objects.filter(doctor_id=doctor_id, is_active=True), today),
+        settings.PATIENT_STATS_CACHE_TTL
+    )
+
+
+def invalidate_patient_stats(doctor_id):
+    delete_keys([stats_cache_key(doctor_id)])
+
@@ -0,0 +1,94 @@
+# patients/tasks.py
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+from core.shared_cache import CACHE_ERRORS, delete_keys, shared_cache
+
+
+RISK_SCORE_LOCK_PREFIX = 'risk-score-pending'
+
+logger = logging.getLogger(__name__)
+
+
+def risk_score_lock_key(patient_id):
+    return f'{RISK_SCORE_LOCK_PREFIX}:{patient_id}'
+
+
+def recompute_risk_scores(patient_ids):
+    """
+    Recalcula ai_risk_score de todos os prontuários dos pacientes informados
+    (sinais vitais do próprio prontuário + idade e condições crônicas atuais).
+    Grava apenas os scores que mudaram; retorna quantos foram atualizados.
+    """
+    import pandas as pd
+    from ai_assistant.services import PredictiveAnalytics
+    from .models import MedicalRecord
+    
+    fields = ['id', 'patient__birth_date', 'patient__chronic_conditions',
+              'blood_pressure_sys', 'weight', 'height', 'ai_risk_score']
+    rows = MedicalRecord.objects.filter(patient_id__in=patient_ids).order_by().values_list(*fields)
+    
+    panel = pd.DataFrame.from_records(list(rows), columns=fields)
+    if panel.empty:
+        return 0
+    
+    panel = panel.rename(columns={'patient__chronic_conditions': 'chronic_conditions'})
+    panel['age'] = PredictiveAnalytics.ages_from_birth_dates(panel['patient__birth_date'])
+    
+    scores = PredictiveAnalytics.calculate_health_risk_scores(panel)['total_score']
+    changed = panel['ai_risk_score'].isna() | (panel['ai_risk_score'] != scores)
+    
+    records = [
+        MedicalRecord(id=record_id, ai_risk_score=int(score))
+        for record_id, score in zip(panel.loc[changed, 'id'], scores[changed])
+    ]
+    MedicalRecord.objects.bulk_update(records, ['ai_risk_score'], batch_size=500)
+    return len(records)
+
+
+@shared_task(ignore_result=True)
+def update_patient_risk_scores(patient_id):
+    """Recalcula os scores de risco de um paciente (agendado pelos signals)"""
+    # Libera a janela antes do cálculo: alterações feitas durante a execução
+    # agendam um novo recálculo (a janela fica no cache compartilhado, visível
+    # para os processos web que a criaram)
+    delete_keys([risk_score_lock_key(patient_id)])
+    return recompute_risk_scores([patient_id])
+
+
+def schedule_risk_score_update(patient_id):
+    """
+    Agenda o recálculo após o commit, agrupando alterações próximas do mesmo
+    paciente em uma única tarefa. Sem broker disponível, calcula na hora.
+    """
+    debounce = settings.AI_RISK_SCORE_DEBOUNCE
+    
+    if not _open_debounce_window(patient_id, timeout=debounce * 2 + 30):
+        return
+    
+    try:
+        update_patient_risk_scores.apply_async(args=[patient_id], countdown=debounce, retry=False)
+    except Exception:
+        logger.warning(
+            'Broker indisponível; recalculando risco do paciente %s de forma síncrona', patient_id
+        )
+        update_patient_risk_scores(patient_id)
+
+
+def _open_debounce_window(patient_id, timeout):
+    """
+    True se não há recálculo pendente para o paciente. Sem cache compartilhado
+    (ou com o Redis indisponível) cada alteração agenda a sua tarefa: uma
+    janela local ao processo nunca seria liberada pelo worker
+    """
+    cache = shared_cache()
+    if cache is None:
+        return True
+    
+    try:
+        return cache.add(risk_score_lock_key(patient_id), 1, timeout=timeout)
+    except CACHE_ERRORS as e:
+        logger.warning('Cache compartilhado indisponível (%s): recálculo sem agrupamento', e)
+        return True
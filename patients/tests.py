@@ -1,3 +1,69 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import override_settings
+
+from api.tests import LOCMEM_SHARED_CACHES, ApiTestCase, process_caches
+from patients.stats import get_patient_stats
+
+
+class PatientStatsCacheTests(ApiTestCase):
+    def test_stats_are_cached_until_a_patient_changes(self):
+        patient = self.create_patient(1, gender='F')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_patient_stats(self.doctor.id)['total_patients'], 1)
+        with self.assertNumQueries(0):
+            get_patient_stats(self.doctor.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.gender = 'M'
+            patient.save()
+            self.create_patient(2, gender='M')
+
+        stats = get_patient_stats(self.doctor.id)
+        self.assertEqual(stats['total_patients'], 2)
+        self.assertEqual(stats['gender_distribution'], {'male': 2, 'female': 0, 'other': 0})
+
+    def test_stats_endpoint(self):
+        self.create_patient(1, chronic_conditions='Hipertensão')
+        self.create_patient(2, is_active=False)
+
+        _, data = self.count_queries('/api/patients/stats/')
+
+        self.assertEqual(data['total_patients'], 1)
+        self.assertEqual(data['patients_with_chronic'], 1)
+
+
+@override_settings(AI_RISK_SCORE_DEBOUNCE=10)
+class RiskScoreDebounceTests(ApiTestCase):
+    def test_worker_releases_window_opened_by_web_process(self):
+        from patients.tasks import schedule_risk_score_update, update_patient_risk_scores
+
+        patient = self.create_patient(1)
+
+        with mock.patch.object(update_patient_risk_scores, 'apply_async') as enqueue:
+            with process_caches('web'):
+                schedule_risk_score_update(patient.id)
+                schedule_risk_score_update(patient.id)
+            self.assertEqual(enqueue.call_count, 1)
+
+            with process_caches('worker'):
+                update_patient_risk_scores(patient.id)
+
+            # Alteração depois do início da tarefa: novo recálculo
+            with process_caches('web'):
+                schedule_risk_score_update(patient.id)
+            self.assertEqual(enqueue.call_count, 2)
+
+    @override_settings(
+        CACHES={**LOCMEM_SHARED_CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        SHARED_CACHE_ENABLED=False
+    )
+    def test_without_shared_cache_every_change_is_scheduled(self):
+        from patients.tasks import schedule_risk_score_update, update_patient_risk_scores
+
+        with mock.patch.object(update_patient_risk_scores, 'apply_async') as enqueue:
+            schedule_risk_score_update(1)
+            schedule_risk_score_update(1)
+
+        self.assertEqual(enqueue.call_count, 2)